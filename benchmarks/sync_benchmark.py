@@ -0,0 +1,232 @@
+"""
+Benchmark the Prices and Shipping sync stages against a scratch MySQL/MariaDB database.
+
+Synthetic sheets in the same layout as the real worksheets are synced once (initial load), then again for
+each round with a fraction of the prices changed. Every stage reports wall time, parse time, statement
+count (from SHOW GLOBAL STATUS deltas) and peak traced Python memory; the report also holds the peak RSS
+of the whole benchmark process. The output is JSON.
+
+The server-wide status counters are only meaningful on a server nothing else is using, e.g.:
+
+    docker run -d --rm --name kawasync-bench -p 3307:3306 -e MYSQL_ROOT_PASSWORD=bench \\
+        -e MYSQL_DATABASE=bench mysql:8
+    python -m benchmarks.sync_benchmark --port 3307 --password bench --output bench.json
+
+The pricing and shipping tables (and their history) of the target database are emptied first.
+
+With --backend sqlite the benchmark runs in-process against a scratch SQLite file instead, and statement
+counts come from the instrumented connections' own counters:
+
+    python -m benchmarks.sync_benchmark --backend sqlite --path bench.db --output bench.json
+"""
+import argparse
+import json
+import platform
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+import mysql.connector
+
+import modules.constants as constants
+from modules.database import Database
+from modules.metrics import metrics
+
+# Status counters sampled around each stage; with the text protocol every statement is one round trip
+STATUS_COUNTERS = ("Questions", "Com_select", "Com_insert", "Com_update", "Com_delete", "Com_commit")
+
+# Tables emptied before the benchmark starts
+BENCHMARK_TABLES = ("pricing", "shipping", "pricing_history", "shipping_history")
+
+
+def generate_pricing_sheet(materials, locations, rng):
+    """
+    Build a Prices sheet: two header rows, then per material a ticker row listing the locations from column D
+    and a row below it holding the prices.
+    """
+    names = [f"LOC{index:03d}" for index in range(locations)]
+    rows = [["Prices"], ["", "Ticker", "", *names]]
+    for index in range(materials):
+        rows.append(["", f"M{index:04d}", "", *names])
+        rows.append(["", "", "", *(f"{rng.uniform(1, 1000):.2f}" for _ in names)])
+    return rows
+
+
+def generate_shipping_sheet(locations, rng):
+    """Build a Shipping sheet: a header row of destinations, then one row of prices per origin."""
+    names = [f"LOC{index:03d}" for index in range(locations)]
+    rows = [["", *names]]
+    for origin in names:
+        rows.append([origin, *("" if origin == destination else f"{rng.uniform(1, 100):.2f}"
+                               for destination in names)])
+    return rows
+
+
+def mutate(rows, price_cells, change_ratio, rng):
+    """Change the given fraction of price cells in place."""
+    for row_index, column in rng.sample(price_cells, int(len(price_cells) * change_ratio)):
+        rows[row_index][column] = f"{rng.uniform(1, 1000):.2f}"
+
+
+def price_cells(rows, first_row, first_column, step):
+    """List the (row, column) positions of every non-empty price cell."""
+    return [(row_index, column) for row_index in range(first_row, len(rows), step)
+            for column in range(first_column, len(rows[row_index])) if rows[row_index][column]]
+
+
+class StatusCounters:
+    """Reads server status counters on a dedicated connection, outside the pool being measured."""
+
+    def __init__(self, args):
+        self.connection = mysql.connector.connect(host=args.host, port=args.port, user=args.user,
+                                                  password=args.password, database=args.database)
+
+    def read(self):
+        cursor = self.connection.cursor()
+        try:
+            placeholders = ", ".join(["%s"] * len(STATUS_COUNTERS))
+            cursor.execute(f"SHOW GLOBAL STATUS WHERE Variable_name IN ({placeholders})", STATUS_COUNTERS)
+            return {name: int(value) for name, value in cursor.fetchall()}
+        finally:
+            cursor.close()
+
+    # The status query itself is one statement
+    overhead = 1
+
+    def close(self):
+        self.connection.close()
+
+
+class MetricsCounters:
+    """Reads the statement counters of the instrumented connections, for backends without server status."""
+
+    overhead = 0
+
+    def read(self):
+        totals = {"Questions": 0}
+        for (name, labels), value in list(metrics.counters.items()):
+            if name == "db_statements_total":
+                command = dict(labels)["command"]
+                totals["Questions"] += int(value)
+                totals[f"Com_{command.lower()}"] = totals.get(f"Com_{command.lower()}", 0) + int(value)
+        return totals
+
+    def close(self):
+        pass
+
+
+def run_stage(db, counters, parse, update, rows, prune):
+    """Parse and sync one sheet, measuring time, statements and memory."""
+    tracemalloc.start()
+    before = counters.read()
+    started = time.perf_counter()
+    records = parse(rows)
+    parsed = time.perf_counter()
+    result = update(records, prune=prune)
+    finished = time.perf_counter()
+    after = counters.read()
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    deltas = {name: after.get(name, 0) - before.get(name, 0) for name in STATUS_COUNTERS}
+    deltas["Questions"] -= counters.overhead
+    return {
+        "wall_seconds": round(finished - started, 6),
+        "parse_seconds": round(parsed - started, 6),
+        "write_seconds": round(finished - parsed, 6),
+        "records": len(records),
+        "result": result,
+        "statements": deltas["Questions"],
+        "commands": {name: value for name, value in deltas.items() if name != "Questions"},
+        "peak_traced_bytes": peak_traced,
+    }
+
+
+def reset_tables(db):
+    def reset(connection):
+        cursor = connection.cursor()
+        try:
+            for table in BENCHMARK_TABLES:
+                cursor.execute(f"DELETE FROM {table}")
+            connection.commit()
+        finally:
+            cursor.close()
+
+    db.run(reset)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=f"Benchmark the {constants.SCRIPT_NAME} sheet sync stages.")
+    parser.add_argument("--backend", choices=("mysql", "sqlite"), default="mysql")
+    parser.add_argument("--path", default="bench.db", help="Scratch database file of the sqlite backend.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3306)
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--database", default="bench", help="Scratch database; its price tables are emptied.")
+    parser.add_argument("--materials", type=int, default=500, help="Materials (ticker rows) in the Prices sheet.")
+    parser.add_argument("--locations", type=int, default=50, help="Locations in both sheets.")
+    parser.add_argument("--change-ratio", type=float, default=0.05,
+                        help="Fraction of prices changed between rounds.")
+    parser.add_argument("--rounds", type=int, default=3, help="Sync rounds after the initial load.")
+    parser.add_argument("--batch-size", type=int, default=constants.DEFAULT_BATCH_SIZE)
+    parser.add_argument("--prune", action="store_true", help="Sync with pruning of vanished rows.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout.")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    db = Database({"backend": args.backend, "path": args.path, "host": args.host, "port": args.port,
+                   "name": args.database, "user": args.user, "password": args.password}, batch_size=args.batch_size)
+    counters = StatusCounters(args) if args.backend == "mysql" else MetricsCounters()
+    reset_tables(db)
+
+    sheets = {
+        "pricing": generate_pricing_sheet(args.materials, args.locations, rng),
+        "shipping": generate_shipping_sheet(args.locations, rng),
+    }
+    cells = {
+        "pricing": price_cells(sheets["pricing"], 3, 3, 2),
+        "shipping": price_cells(sheets["shipping"], 1, 1, 1),
+    }
+    stages = {
+        "pricing": (db.parse_pricing_data, db.update_pricing_data),
+        "shipping": (db.parse_shipping_data, db.update_shipping_data),
+    }
+
+    rounds = []
+    for round_index in range(args.rounds + 1):
+        if round_index:
+            for stage in sheets:
+                mutate(sheets[stage], cells[stage], args.change_ratio, rng)
+        rounds.append({
+            "round": round_index,
+            "kind": "changes" if round_index else "initial_load",
+            "stages": {stage: run_stage(db, counters, parse, update, sheets[stage], args.prune)
+                       for stage, (parse, update) in stages.items()},
+        })
+
+    report = {
+        "version": constants.VERSION,
+        "python": platform.python_version(),
+        "parameters": {name: value for name, value in vars(args).items() if name != "password"},
+        "rounds": rounds,
+        # ru_maxrss is the peak of the whole process over every stage, in KiB on Linux and bytes on macOS
+        "process_peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin"
+                                                                                         else 1024),
+    }
+    counters.close()
+    db.close()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,41 @@
+import argparse
+import logging
+
+from modules.arbitrage import scan_arbitrage
+from modules.burn_rate import update_burn_rates
+from modules.catalog import load_catalogs
 from modules.config import Config
 from modules.database import Database
+from modules.export import SnapshotExporter
+from modules.fio import FioClient, run_production_sync, run_storage_sync
 from modules.google import GoogleSheets
+from modules.history import maintain_history
+from modules.inventory import InventoryIndex
+from modules.metrics import metrics
+from modules.pricebook import PriceBook
+from modules.query_server import QueryServer
+from modules.routing import RouteTable
+from modules.scheduler import Scheduler
+from modules.supply import update_supply_projection
+from modules.sync import STAGES, run_pipelined, run_stages
 import modules.constants as constants
 
+parser = argparse.ArgumentParser(description=f"{constants.SCRIPT_NAME} - sync Google Sheets data into MySQL.")
+parser.add_argument("--force", action="store_true", help="Run every sync stage even if its sheet is unchanged.")
+parser.add_argument("--pipeline", action="store_true",
+                    help="Fetch and write every sync stage concurrently on separate connections.")
+parser.add_argument("--daemon", action="store_true",
+                    help="Keep running and sync each stage on its own schedule until SIGTERM.")
+parser.add_argument("--non-interactive", action="store_true",
+                    help="Fail instead of prompting when the configuration is incomplete or invalid.")
+parser.add_argument("--log-level",
+                    help="Logging level, e.g. DEBUG or INFO. Defaults to logging.level in the config, or WARNING.")
+parser.add_argument("--serve", action="store_true",
+                    help="With --daemon, also answer price, route and inventory queries over HTTP.")
+args = parser.parse_args()
+if args.serve and not args.daemon:
+    parser.error("--serve requires --daemon")
+
 # Initialize database connection
 name_version_str = f"{constants.SCRIPT_NAME} v{constants.VERSION}"
 box_width = len(name_version_str) + 2
@@ -10,19 +43,126 @@ print("+" + "-" * (box_width) + "+")
 print("| " + name_version_str + " |")
 print("+" + "-" * (box_width) + "+")
 
-config = Config()
-db = Database(config.get("database"))
-db.connect()
+config = Config(non_interactive=args.non_interactive)
+logging.basicConfig(level=(args.log_level or config.get("logging", "level", "WARNING")).upper(),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+db = Database(config.get("database"),
+              batch_size=config.get("sync", "batch_size", constants.DEFAULT_BATCH_SIZE),
+              pool_size=config.get("sync", "pool_size", constants.DEFAULT_POOL_SIZE),
+              max_retries=config.get("sync", "max_retries", constants.DEFAULT_MAX_RETRIES))
 
 # Initialize Google Sheets instance
 google_sheets = GoogleSheets(credentials_file="credentials.json", file_id="10GLtvQqgf2SL6gpFKoGLiPRt1MyzUYzghsGCBmaLlU4")
 
-# Fetch pricing and shipping data from Google Sheets
-pricing_data = google_sheets.fetch_data(sheet_name="Prices")
-shipping_data = google_sheets.fetch_data(sheet_name="Shipping")
+# Shared FIO client; each API key is rate limited separately
+fio_client = FioClient(rate_limit=config.get("fio", "rate_limit", constants.DEFAULT_FIO_RATE_LIMIT))
+fio_workers = config.get("fio", "workers", constants.DEFAULT_FIO_WORKERS)
+restock_days = config.get("supply", "target_days", constants.DEFAULT_RESTOCK_TARGET_DAYS)
+
+# Cheapest multi-hop shipping routes, reused by every arbitrage scan. The first scan loads them once the
+# shipping sync has run, so a cold cache is not solved for the old shipping table first
+routes = RouteTable(db, refresh=False)
+arbitrage_top_n = config.get("arbitrage", "top_n", constants.DEFAULT_ARBITRAGE_TOP_N)
+history_retain_months = config.get("history", "retain_months", constants.DEFAULT_HISTORY_RETAIN_MONTHS)
+
+# Columnar snapshots for analytics, written after each sync when export.dir is set
+exporter = None
+if config.get("export", "dir"):
+    exporter = SnapshotExporter(db, config.get("export", "dir"), file_format=config.get("export", "format"))
+
+
+def export_snapshots(force=False):
+    """Export changed tables as columnar snapshots, if exporting is enabled."""
+    if exporter is not None:
+        exporter.export(force=force)
+
+
+def export_metrics():
+    """Write run metrics to the configured Prometheus textfile and/or JSON file."""
+    metrics.export(textfile=config.get("metrics", "textfile"), json_file=config.get("metrics", "json_file"))
+
+
+sync_options = {
+    "prune": config.get("sync", "prune_vanished", False),
+    "trust_modified_time": config.get("sync", "trust_modified_time", False),
+    "page_rows": config.get("sync", "page_rows", None),
+}
+
+if args.daemon:
+    # Connections and the authorized Sheets client stay warm between runs
+    google_sheets.open_spreadsheet()
+    scheduler = Scheduler(after_run=export_metrics)
+    jitter = config.get("schedule", "jitter", constants.DEFAULT_JOB_JITTER)
+
+    # The price book follows pricing and shipping syncs through its listener; inventory is refreshed below
+    inventory = None
+    server = None
+    if args.serve:
+        routes.refresh()  # Arbitrage scans skipped while shipping is unchanged would otherwise leave it empty
+        inventory = InventoryIndex(db)
+        server = QueryServer(PriceBook(db, max_entries=config.get("pricebook", "max_entries",
+                                                                  constants.DEFAULT_PRICEBOOK_MAX_ENTRIES)),
+                             routes, inventory, host=config.get("server", "host", constants.DEFAULT_SERVER_HOST),
+                             port=config.get("server", "port", constants.DEFAULT_SERVER_PORT))
+        server.start()
+
+    def make_stage_job(stage):
+        force = args.force  # --force only applies to the first run
+
+        def job():
+            nonlocal force
+            run_stages(db, google_sheets, force=force, stages=[stage], **sync_options)
+            scan_arbitrage(db, routes, top_n=arbitrage_top_n)
+            export_snapshots()
+            force = False
+
+        return job
+
+    for stage in STAGES:
+        scheduler.add_job(stage, config.get("schedule", stage, constants.DEFAULT_JOB_INTERVAL),
+                          make_stage_job(stage), jitter=jitter)
+    scheduler.add_job("history", config.get("schedule", "history", constants.DEFAULT_HISTORY_INTERVAL),
+                      lambda: maintain_history(db, retain_months=history_retain_months), jitter=jitter)
+    scheduler.add_job("catalog", config.get("schedule", "catalog", constants.DEFAULT_CATALOG_INTERVAL),
+                      lambda: load_catalogs(db, fio_client, config.get("fio", "api_key")), jitter=jitter)
+
+    def storage_job():
+        run_storage_sync(db, fio_client, workers=fio_workers)
+        if inventory is not None:
+            inventory.refresh()
+        update_supply_projection(db, target_days=restock_days)
+        export_snapshots()
+
+    def production_job():
+        run_production_sync(db, fio_client, workers=fio_workers)
+        update_burn_rates(db)
+        update_supply_projection(db, target_days=restock_days)
+        export_snapshots()
 
-# Parse and update the database with fetched data
-db.parse_and_update_pricing_data(pricing_data)
-db.parse_and_update_shipping_data(shipping_data)
+    scheduler.add_job("fio_storage", config.get("schedule", "fio_storage", constants.DEFAULT_JOB_INTERVAL),
+                      storage_job, jitter=jitter)
+    scheduler.add_job("fio_production", config.get("schedule", "fio_production", constants.DEFAULT_JOB_INTERVAL),
+                      production_job, jitter=jitter)
 
-db.close()
+    print(f"Running as a daemon with {len(scheduler.jobs)} jobs. Send SIGTERM to stop.")
+    scheduler.run_forever()
+    if server is not None:
+        server.stop()
+    db.close()
+else:
+    # Metrics are exported and the pool closed even when a stage raises, so a failed run still reports
+    try:
+        # Fetch each sheet and update the database, skipping stages whose sheet has not changed
+        run = run_pipelined if args.pipeline else run_stages
+        run(db, google_sheets, force=args.force, **sync_options)
+        scan_arbitrage(db, routes, top_n=arbitrage_top_n, force=args.force)
+        maintain_history(db, retain_months=history_retain_months)
+        load_catalogs(db, fio_client, config.get("fio", "api_key"), force=args.force)
+        run_storage_sync(db, fio_client, workers=fio_workers)
+        run_production_sync(db, fio_client, workers=fio_workers)
+        update_burn_rates(db, force=args.force)
+        update_supply_projection(db, target_days=restock_days, force=args.force)
+        export_snapshots(force=args.force)
+    finally:
+        export_metrics()
+        db.close()
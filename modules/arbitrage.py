@@ -0,0 +1,113 @@
+import hashlib
+
+import numpy as np
+
+import modules.constants as constants
+from modules.burn_rate import factorize
+from modules.metrics import metrics
+
+OPPORTUNITY_COLUMNS = ("mat", "position", "buy_location", "sell_location", "buy_price", "sell_price",
+                       "shipping_cost", "profit")
+
+
+def find_opportunities(prices, shipping, top_n=constants.DEFAULT_ARBITRAGE_TOP_N,
+                       chunk_bytes=constants.ARBITRAGE_CHUNK_BYTES):
+    """
+    Find the most profitable buy-here, ship, sell-there trades for every material.
+    For a chunk of materials, profit[m, i, j] = price[m, j] - price[m, i] - shipping[i, j] is computed in one
+    broadcast, and the top N per material are selected with argpartition. Chunks are sized so that one
+    profit array stays within chunk_bytes, whatever the number of materials.
+    :param prices: (materials, locations) array of prices, NaN where a material has no price.
+    :param shipping: (locations, locations) array of cheapest shipping costs, np.inf where unreachable.
+    :param top_n: Maximum number of opportunities kept per material.
+    :param chunk_bytes: Memory budget of one chunk's profit array.
+    :return: Generator of (material index, buy location index, sell location index, profit), best first per
+        material. Only trades with a positive profit are yielded.
+    """
+    materials, locations = prices.shape
+    if not materials or locations < 2:
+        return
+    pairs = locations * locations
+    n = min(top_n, pairs)
+    chunk = max(1, chunk_bytes // (pairs * prices.itemsize))
+    same_location = np.eye(locations, dtype=bool).reshape(-1)
+
+    for start in range(0, materials, chunk):
+        block = prices[start:start + chunk]
+        profit = (block[:, None, :] - block[:, :, None] - shipping[None, :, :]).reshape(len(block), pairs)
+        profit[np.isnan(profit)] = -np.inf
+        profit[:, same_location] = -np.inf
+
+        top = np.argpartition(-profit, n - 1, axis=1)[:, :n]
+        top_profit = np.take_along_axis(profit, top, axis=1)
+        order = np.argsort(-top_profit, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_profit = np.take_along_axis(top_profit, order, axis=1)
+
+        for row in range(len(block)):
+            for flat, value in zip(top[row].tolist(), top_profit[row].tolist()):
+                if not value > 0:
+                    break
+                buy, sell = divmod(flat, locations)
+                yield start + row, buy, sell, value
+
+
+def _load_prices(db):
+    """Read the pricing table into a dense (materials, locations) array."""
+    rows = db.fetch_rows("SELECT mat, location, price FROM pricing")
+    if not rows:
+        return [], [], np.zeros((0, 0))
+    mats, locations, values = zip(*rows)
+    mat_values, mat_codes = factorize(mats)
+    location_values, location_codes = factorize(locations)
+    prices = np.full((len(mat_values), len(location_values)), np.nan)
+    prices[mat_codes, location_codes] = values
+    return mat_values.tolist(), location_values.tolist(), prices
+
+
+@metrics.timed_stage("arbitrage")
+def scan_arbitrage(db, routes, top_n=constants.DEFAULT_ARBITRAGE_TOP_N, force=False):
+    """
+    Rescan arbitrage opportunities and replace the arbitrage_opportunities table.
+    The scan is skipped when neither the pricing nor the shipping sync fingerprint moved since the last one,
+    so it is cheap to call after every sync.
+    :param db: Database instance to read from and write to.
+    :param routes: RouteTable providing cheapest multi-hop shipping costs.
+    :param top_n: Maximum number of opportunities kept per material.
+    :param force: Rescan even if pricing and shipping are unchanged.
+    :return: Number of opportunities written, or None if the scan was skipped or failed.
+    """
+    state = db.get_sync_state()
+    sources = [state.get(stage, {}).get("content_hash", "") for stage in ("pricing", "shipping")] + [str(top_n)]
+    content_hash = hashlib.sha256("\0".join(sources).encode("utf-8")).hexdigest()
+    if not force and state.get("arbitrage", {}).get("content_hash") == content_hash:
+        print("Skipping arbitrage scan: pricing and shipping unchanged since the last scan.")
+        return None
+
+    routes.refresh()
+    mats, locations, prices = _load_prices(db)
+    shipping = routes.cost_matrix(locations)
+    rows = []
+    position = {}
+    for mat, buy, sell, profit in find_opportunities(prices, shipping, top_n=top_n):
+        position[mat] = position.get(mat, 0) + 1
+        rows.append((mats[mat], position[mat], locations[buy], locations[sell], float(prices[mat, buy]),
+                     float(prices[mat, sell]), float(shipping[buy, sell]), profit))
+
+    def replace(connection):
+        cursor = connection.cursor()
+        try:
+            cursor.execute("DELETE FROM arbitrage_opportunities")
+            db.insert_rows(cursor, "arbitrage_opportunities", OPPORTUNITY_COLUMNS, rows)
+            connection.commit()
+        finally:
+            cursor.close()
+
+    try:
+        db.run(replace)
+    except Exception as e:
+        print(f"Error writing arbitrage opportunities: {e}")
+        return None
+    db.set_sync_state("arbitrage", content_hash)
+    print(f"Found {len(rows)} arbitrage opportunities across {len(position)} materials.")
+    return len(rows)
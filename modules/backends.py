@@ -0,0 +1,317 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+
+from mysql.connector import Error as MySQLError, pooling
+from mysql.connector.errors import PoolError
+
+import modules.constants as constants
+from modules.migrations import ALREADY_APPLIED_ERRORS, MIGRATIONS, SQLITE_MIGRATIONS
+
+# Errors raised by the connections of any backend
+DATABASE_ERRORS = (MySQLError, sqlite3.Error)
+
+# Seconds to wait for a free pooled connection (or the migration lock) before giving up
+POOL_TIMEOUT = 30
+
+# MySQL error codes worth retrying: server has gone away, lost connection, connection not available,
+# lock wait timeout and deadlock
+TRANSIENT_ERRORS = {2006, 2013, 2055, 1205, 1213}
+
+# MySQL error raised when a table does not exist
+ER_NO_SUCH_TABLE = 1146
+
+# Named lock held while applying schema migrations
+MIGRATION_LOCK = f"{constants.SCRIPT_NAME}-migrations"
+
+# SQLite result codes worth retrying: another connection holds a conflicting lock
+SQLITE_TRANSIENT_ERRORS = {sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED}
+
+# Oldest SQLite with upserts (ON CONFLICT DO UPDATE without a conflict target) and row values
+SQLITE_MIN_VERSION = (3, 35, 0)
+
+# DATETIME, TIMESTAMP and DATE columns are stored as ISO 8601 text and read back as the types MySQL returns
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+for _type in ("DATETIME", "TIMESTAMP"):
+    sqlite3.register_converter(_type, lambda value: datetime.fromisoformat(value.decode("utf-8")))
+sqlite3.register_converter("DATE", lambda value: date.fromisoformat(value.decode("utf-8")))
+
+
+class MySQLBackend:
+    """MySQL or MariaDB server, reached through a mysql.connector connection pool."""
+
+    migrations = MIGRATIONS
+    supports_partitions = True
+
+    def __init__(self, db_config, pool_size):
+        """
+        :param db_config: Database settings with host, port, name, user and password.
+        :param pool_size: Number of pooled connections.
+        """
+        self.host = db_config.get("host", "localhost")
+        self.port = int(db_config.get("port") or 3306)
+        self.name = db_config.get("name", "")
+        self.user = db_config.get("user", "")
+        self.password = db_config.get("password", "")
+        self.pool_size = pool_size
+        self.pool = None
+
+    def connect(self):
+        """Create the connection pool."""
+        self.pool = pooling.MySQLConnectionPool(
+            pool_name=f"{constants.SCRIPT_NAME}-{id(self)}",
+            pool_size=self.pool_size,
+            pool_reset_session=False,  # Saves a round trip per checkout; sessions hold no state
+            host=self.host,
+            port=self.port,
+            database=self.name,
+            user=self.user,
+            password=self.password
+        )
+        print(f"Connected to the database '{self.name}' at {self.host}:{self.port} (pool size {self.pool_size})")
+
+    def close(self):
+        """Close every idle pooled connection."""
+        if self.pool is not None:
+            # MySQLConnectionPool has no public way to close its connections
+            self.pool._remove_connections()
+            self.pool = None
+
+    def get_connection(self):
+        """
+        Take a connection from the pool, waiting up to POOL_TIMEOUT seconds for one to be returned.
+        The pool pings each connection (and reconnects it if needed) before handing it out.
+        """
+        pool = self.pool
+        if pool is None:
+            raise PoolError(msg="No database connection pool available.")
+        deadline = time.monotonic() + POOL_TIMEOUT
+        while True:
+            try:
+                return pool.get_connection()
+            except PoolError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.05)
+
+    @staticmethod
+    def release(connection):
+        """Return a connection to the pool."""
+        try:
+            connection.close()
+        except MySQLError:
+            pass
+
+    @staticmethod
+    def is_transient(error):
+        return getattr(error, "errno", None) in TRANSIENT_ERRORS
+
+    @staticmethod
+    def is_missing_table(error):
+        return getattr(error, "errno", None) == ER_NO_SUCH_TABLE
+
+    @staticmethod
+    def is_already_applied(error):
+        return getattr(error, "errno", None) in ALREADY_APPLIED_ERRORS
+
+    @staticmethod
+    def lock_migrations(cursor):
+        """Take the server-wide named lock serializing migrations across processes."""
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK, POOL_TIMEOUT))
+        (acquired,) = cursor.fetchone()
+        # GET_LOCK returns 0 on timeout and NULL on error; migrating without the lock could race another process
+        if acquired != 1:
+            raise MySQLError(msg=f"Could not acquire the migration lock '{MIGRATION_LOCK}' within {POOL_TIMEOUT}s "
+                                 f"(GET_LOCK returned {acquired}).")
+
+    @staticmethod
+    def unlock_migrations(cursor):
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+        cursor.fetchone()
+
+    @staticmethod
+    def upsert_clause(update_columns):
+        """Return the INSERT suffix overwriting update_columns when a row's unique key already exists."""
+        return "ON DUPLICATE KEY UPDATE " + ", ".join(f"{column} = VALUES({column})" for column in update_columns)
+
+
+class SQLiteCursor:
+    """
+    Cursor wrapper giving sqlite3 cursors the interface of mysql.connector ones: %s placeholders, and rows
+    as dicts when opened with dictionary=True.
+    """
+
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    def execute(self, operation, params=None):
+        return self._cursor.execute(operation.replace("%s", "?"), params or ())
+
+    def executemany(self, operation, seq_params):
+        return self._cursor.executemany(operation.replace("%s", "?"), seq_params)
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip([column[0] for column in self._cursor.description], row))
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return (self._row(row) for row in self._cursor)
+
+
+class SQLiteConnection:
+    """Connection wrapper whose cursors are SQLiteCursor instances."""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, dictionary=False):
+        return SQLiteCursor(self._connection.cursor(), dictionary)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class SQLiteBackend:
+    """
+    Embedded SQLite database file in WAL mode, for single-node installs without a MySQL server.
+    Readers never block the writer or each other under WAL, and writers queue on the database lock for up to
+    POOL_TIMEOUT seconds before the error is reported (and retried) as transient.
+    """
+
+    migrations = SQLITE_MIGRATIONS
+    supports_partitions = False
+
+    def __init__(self, db_config, pool_size):
+        """
+        :param db_config: Database settings with the path of the database file.
+        :param pool_size: Maximum number of open connections.
+        """
+        self.path = db_config.get("path") or constants.DEFAULT_SQLITE_PATH
+        self.name = self.path
+        self.pool_size = pool_size
+        self.pool = None
+        self.opened = 0
+        self._lock = threading.Lock()
+
+    def connect(self):
+        """Check the SQLite version and prepare the connection pool; connections are opened on demand."""
+        if sqlite3.sqlite_version_info < SQLITE_MIN_VERSION:
+            raise sqlite3.NotSupportedError(f"SQLite {sqlite3.sqlite_version} is too old; "
+                                            f"{'.'.join(map(str, SQLITE_MIN_VERSION))} or newer is required.")
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.pool = queue.LifoQueue()
+        self.opened = 0
+        self.release(self.get_connection())  # Fail early if the file cannot be opened
+        print(f"Opened the SQLite database '{self.path}' (pool size {self.pool_size})")
+
+    def _open(self):
+        connection = sqlite3.connect(self.path, timeout=POOL_TIMEOUT, check_same_thread=False,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")  # WAL stays consistent; only the last commits can be lost
+        connection.execute("PRAGMA foreign_keys = ON")
+        return SQLiteConnection(connection)
+
+    def close(self):
+        """Close every idle pooled connection."""
+        pool = self.pool
+        self.pool = None
+        while pool is not None:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def get_connection(self):
+        """Take an idle connection, open a new one while under pool_size, or wait for one to be returned."""
+        pool = self.pool
+        if pool is None:
+            raise sqlite3.OperationalError("No database connection pool available.")
+        try:
+            return pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self.opened < self.pool_size:
+                self.opened += 1
+                try:
+                    return self._open()
+                except sqlite3.Error:
+                    self.opened -= 1
+                    raise
+        try:
+            return pool.get(timeout=POOL_TIMEOUT)
+        except queue.Empty:
+            raise sqlite3.OperationalError("No pooled connection became available.")
+
+    def release(self, connection):
+        """Return a connection to the pool, ending any transaction it left open."""
+        if connection.in_transaction:
+            connection.rollback()
+        if self.pool is None:
+            connection.close()
+        else:
+            self.pool.put(connection)
+
+    @staticmethod
+    def is_transient(error):
+        return (getattr(error, "sqlite_errorcode", 0) & 0xff) in SQLITE_TRANSIENT_ERRORS  # Base code of extended codes
+
+    @staticmethod
+    def is_missing_table(error):
+        return str(error).startswith("no such table")
+
+    @staticmethod
+    def is_already_applied(error):
+        return str(error).startswith("duplicate column name")
+
+    @staticmethod
+    def lock_migrations(cursor):
+        """Take the database write lock; DDL is transactional in SQLite, so it is released by the commit."""
+        cursor.execute("BEGIN IMMEDIATE")
+
+    @staticmethod
+    def unlock_migrations(cursor):
+        pass
+
+    @staticmethod
+    def upsert_clause(update_columns):
+        """Return the INSERT suffix overwriting update_columns when a row's unique key already exists."""
+        return "ON CONFLICT DO UPDATE SET " + ", ".join(f"{column} = excluded.{column}" for column in update_columns)
+
+
+# Backends selectable with the "backend" key of the database settings
+BACKENDS = {
+    "mysql": MySQLBackend,
+    "sqlite": SQLiteBackend,
+}
+
+
+def create_backend(db_config, pool_size):
+    """
+    Build the storage backend named by the database settings.
+    :param db_config: Database settings; "backend" selects the engine and defaults to "mysql".
+    :param pool_size: Number of pooled connections.
+    :return: Backend instance, not yet connected.
+    """
+    name = db_config.get("backend", "mysql")
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown database backend '{name}'; expected one of {', '.join(BACKENDS)}.")
+    return BACKENDS[name](db_config, pool_size)
@@ -0,0 +1,98 @@
+import numpy as np
+
+from modules.metrics import metrics
+
+# Milliseconds in a day, to turn per-order amounts into daily rates
+MS_PER_DAY = 24 * 3600 * 1000
+
+BURN_RATE_COLUMNS = ("prun_username", "planet_natural_id", "planet_name", "material_ticker", "daily_consumption",
+                     "essential")
+
+
+def factorize(values):
+    """Encode values as integer codes into their sorted unique values."""
+    return np.unique(np.asarray(values, dtype=object), return_inverse=True)
+
+
+def compute_burn_rates(order_materials, lines, natural_ids):
+    """
+    Compute net daily consumption per (user, planet, ticker) with grouped array reductions.
+    A line runs its recurring orders one after the other on each of its capacity slots, so an order comes
+    around once per cycle of the line: the sum of the durations of all its recurring orders. Each order
+    material therefore contributes amount * capacity * MS_PER_DAY / cycle_ms, positive for inputs and negative
+    for outputs. A material is essential on a planet when a recurring order consumes it and the planet uses
+    more of it than it makes.
+    :param order_materials: List of (prun_username, planet_name, production_line_id, material_ticker,
+        material_amount, direction) rows of recurring orders, with direction 1 for inputs and -1 for outputs.
+    :param lines: Dict mapping production_line_id to (capacity, cycle_ms), cycle_ms being the summed
+        duration_ms of the line's recurring orders.
+    :param natural_ids: Dict mapping (prun_username, planet_name) to the planet's natural id.
+    :return: List of burn_rate rows in BURN_RATE_COLUMNS order.
+    """
+    if not order_materials:
+        return []
+
+    usernames, planet_names, line_ids, tickers, amounts, directions = zip(*order_materials)
+    user_values, user_codes = factorize(usernames)
+    planet_values, planet_codes = factorize(planet_names)
+    ticker_values, ticker_codes = factorize(tickers)
+    capacities, cycles = np.asarray([lines[line_id] for line_id in line_ids], dtype=np.float64).T
+    directions = np.asarray(directions, dtype=np.float64)
+
+    # One int64 key per (user, planet, ticker), so grouping is a single unique over integers
+    keys = (user_codes.astype(np.int64) * len(planet_values) + planet_codes) * len(ticker_values) + ticker_codes
+    groups, group_codes = np.unique(keys, return_inverse=True)
+    daily = np.asarray(amounts, dtype=np.float64) * capacities * MS_PER_DAY / cycles * directions
+    net = np.bincount(group_codes, weights=daily, minlength=len(groups))
+    consumed = np.bincount(group_codes, weights=directions > 0, minlength=len(groups)) > 0
+    essential = consumed & (net > 0)
+
+    user_index, remainder = np.divmod(groups, len(planet_values) * len(ticker_values))
+    planet_index, ticker_index = np.divmod(remainder, len(ticker_values))
+    rows = []
+    for user, planet, ticker, consumption, is_essential in zip(user_values[user_index], planet_values[planet_index],
+                                                               ticker_values[ticker_index], net.tolist(),
+                                                               essential.tolist()):
+        rows.append((user, natural_ids.get((user, planet), planet), planet, ticker, consumption, is_essential))
+    return rows
+
+
+def _load_order_materials(cursor, usernames):
+    """Read the materials of the users' recurring orders, their lines' capacity and cycle, and planet natural ids."""
+    user_placeholders = ", ".join(["%s"] * len(usernames))
+    query = (f"SELECT l.prun_username, l.planet_name, l.production_line_id, c.material_ticker, c.material_amount, "
+             f"{{}} FROM {{}} c JOIN production_orders o ON o.order_id = c.production_order_id "
+             f"JOIN production_lines l ON l.production_line_id = o.production_line_id "
+             f"WHERE o.recurring AND o.duration_ms > 0 AND l.prun_username IN ({user_placeholders})")
+    cursor.execute(f"{query.format(1, 'order_inputs')} UNION ALL {query.format(-1, 'order_outputs')}",
+                   list(usernames) * 2)
+    order_materials = cursor.fetchall()
+
+    cursor.execute(f"SELECT l.production_line_id, l.capacity, SUM(o.duration_ms) FROM production_lines l "
+                   f"JOIN production_orders o ON o.production_line_id = l.production_line_id "
+                   f"WHERE o.recurring AND o.duration_ms > 0 AND l.prun_username IN ({user_placeholders}) "
+                   f"GROUP BY l.production_line_id, l.capacity", list(usernames))
+    lines = {line_id: (capacity, cycle_ms) for line_id, capacity, cycle_ms in cursor.fetchall()}
+
+    cursor.execute(f"SELECT prun_username, planet_name, planet_natural_id FROM user_planets "
+                   f"WHERE prun_username IN ({user_placeholders})", list(usernames))
+    natural_ids = {(username, planet_name): natural_id for username, planet_name, natural_id in cursor.fetchall()}
+    return order_materials, lines, natural_ids
+
+
+@metrics.timed_stage("burn_rate")
+def update_burn_rates(db, force=False):
+    """
+    Recompute the burn_rate rows of every user whose production data changed since their last computation.
+    Each user's burn_rate:<user> sync_state entry records the production:<user> fingerprint it was computed
+    from. Users are processed in batches; each batch is read, computed and replaced in one transaction.
+    :param db: Database instance to read from and write to.
+    :param force: Recompute every user with synced production data.
+    :return: List of usernames whose burn rates were recomputed.
+    """
+    state = db.get_sync_state()
+    production = {stage.split(":", 1)[1]: entry["content_hash"]
+                  for stage, entry in state.items() if stage.startswith("production:")}
+    return db.replace_user_rows("burn_rate", BURN_RATE_COLUMNS,
+                                lambda cursor, usernames: compute_burn_rates(*_load_order_materials(cursor, usernames)),
+                                production, "burn_rate", state, force=force)
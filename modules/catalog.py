@@ -0,0 +1,156 @@
+import json
+
+import requests
+
+import modules.constants as constants
+from modules.metrics import metrics
+
+# Characters allowed between the items of a JSON array
+_SEPARATORS = " \t\r\n,"
+
+
+def iter_json_array(file, chunk_size=constants.HTTP_CHUNK_SIZE):
+    """
+    Incrementally parse a top-level JSON array, yielding one item at a time.
+    Only the item being decoded and one read chunk are held in memory, whatever the size of the array.
+    :param file: Text file object positioned at the start of the array.
+    :param chunk_size: Number of characters read at a time.
+    :return: Generator of decoded items.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    while not buffer:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        buffer = chunk.lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("Expected a JSON array.")
+    position = 1
+    eof = False
+
+    while True:
+        while position < len(buffer) and buffer[position] in _SEPARATORS:
+            position += 1
+        if position < len(buffer) and buffer[position] == "]":
+            return
+        if position < len(buffer):
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+                # A number is only complete once a separator follows it; it may be cut off mid-chunk
+                if eof or (end < len(buffer) and buffer[end] in _SEPARATORS + "]"):
+                    yield item
+                    position = end
+                    continue
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+        elif eof:
+            raise ValueError("Unexpected end of JSON array.")
+
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def _material_row(item):
+    return item["Ticker"], item.get("Name") or item["Ticker"], item.get("Weight") or 0, item.get("Volume") or 0
+
+
+def _planet_row(item, material_tickers):
+    richness = {
+        material_tickers.get(resource.get("MaterialId"), resource.get("MaterialId")): {
+            "type": resource.get("ResourceType"),
+            "factor": resource.get("Factor"),
+        }
+        for resource in item.get("Resources") or []
+    }
+    return (item["PlanetNaturalId"], item.get("PlanetName") or item["PlanetNaturalId"], None,
+            json.dumps(richness, separators=(",", ":")))
+
+
+# Catalogs in load order: name -> FIO endpoint, table, columns and columns refreshed on an existing key
+CATALOGS = {
+    "materials": {
+        "path": "/material/allmaterials",
+        "table": "materials",
+        "columns": ("ticker", "name", "weight", "volume"),
+        "update_columns": ("name", "weight", "volume"),
+    },
+    "planets": {
+        "path": "/planet/allplanets/full",
+        "table": "planets",
+        "columns": ("natural_id", "name", "description", "resource_richness"),
+        "update_columns": ("name", "resource_richness"),
+    },
+}
+
+
+@metrics.timed_stage("catalog")
+def load_catalogs(db, client, api_key, force=False):
+    """
+    Refresh the materials and planets tables from FIO's full dumps.
+    Each dump is streamed to the response cache, and its hash is compared with the one stored in sync_state
+    by the last successful load; unchanged catalogs are skipped. Changed ones are parsed incrementally and
+    written in chunked multi-row upserts inside one transaction, so memory use does not grow with the dump.
+    A catalog that cannot be fetched or parsed is reported and skipped, like the other FIO stages.
+    :param db: Database instance to write to.
+    :param client: FioClient to fetch with.
+    :param api_key: FIO API key to authenticate with.
+    :param force: Reload every catalog regardless of its stored hash.
+    """
+    state = {} if force else db.get_sync_state()
+    responses = {}
+
+    material_tickers = None
+    for name, spec in CATALOGS.items():
+        stage = f"catalog:{name}"
+        try:
+            response = responses[name] = client.get(spec["path"], api_key)
+            if state.get(stage, {}).get("content_hash") == response.body_hash:
+                print(f"Skipping {name} catalog: unchanged since the last load.")
+                continue
+
+            if name == "planets":
+                # Resources reference materials by id; map them to tickers from the (cached) material dump
+                if "materials" not in responses:
+                    print("Skipping planets catalog: the materials catalog could not be fetched.")
+                    continue
+                if material_tickers is None:
+                    with responses["materials"].open() as file:
+                        material_tickers = {item.get("MaterialId"): item.get("Ticker")
+                                            for item in iter_json_array(file)}
+                to_row = lambda item: _planet_row(item, material_tickers)
+            else:
+                to_row = _material_row
+        except (requests.RequestException, ValueError) as e:
+            print(f"Error fetching {name} catalog: {e}")
+            continue
+
+        def load(connection):
+            cursor = connection.cursor()
+            count = 0
+            try:
+                with response.open() as file:
+                    batch = []
+                    for item in iter_json_array(file):
+                        batch.append(to_row(item))
+                        if len(batch) >= db.batch_size:
+                            db.insert_rows(cursor, spec["table"], spec["columns"], batch, spec["update_columns"])
+                            count += len(batch)
+                            batch = []
+                    db.insert_rows(cursor, spec["table"], spec["columns"], batch, spec["update_columns"])
+                    count += len(batch)
+                connection.commit()
+            finally:
+                cursor.close()
+            return count
+
+        try:
+            count = db.run(load)
+        except Exception as e:
+            print(f"Error loading {name} catalog: {e}")
+            continue
+        db.set_sync_state(stage, response.body_hash)
+        print(f"Loaded {count} entries into the {name} catalog.")
@@ -1,8 +1,12 @@
 # modules/config.py
 from modules.config_utils import test_database_connection, test_github_access, verify_email_settings, verify_fio_api_key
+import modules.constants as constants
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import os
 import json
 import subprocess
+import time
 
 class Config:
     DEFAULT_STRUCTURE = {
@@ -28,8 +32,23 @@ class Config:
         }
     }
 
-    def __init__(self, config_file="config.json"):
+    # Sections whose credentials are verified with a network probe
+    PROBES = {
+        "database": lambda settings: test_database_connection(**settings["database"]),
+        "github": lambda settings: test_github_access(settings["github"].get("repo_name", ""),
+                                                      settings["github"].get("pat", "")),
+    }
+
+    def __init__(self, config_file="config.json", non_interactive=False, cache_file=constants.CONFIG_CACHE_FILE):
+        """
+        Load and validate the configuration, prompting for anything missing or broken.
+        :param config_file: Path to the JSON configuration file.
+        :param non_interactive: Raise instead of prompting when the configuration is incomplete or invalid.
+        :param cache_file: Path to the file recording when each credential section was last verified.
+        """
         self.config_file = config_file
+        self.cache_file = cache_file
+        self.non_interactive = non_interactive
         self.settings = {}
 
         # Attempt to load existing configuration
@@ -48,21 +67,19 @@ class Config:
                     self.settings = json.load(file)
                     if not self.is_valid():
                         print("Configuration file is invalid or incomplete. Starting setup...")
-                        self.setup()
-                    else:
-                        self.test_config()
             except json.JSONDecodeError:
                 print(f"Error: Could not parse {self.config_file}. Starting setup...")
-                self.setup()
         else:
             print(f"Configuration file {self.config_file} not found. Starting setup...")
-            self.setup()
 
     def is_valid(self):
         # Validate that all required sections and keys exist
         for section, keys in self.DEFAULT_STRUCTURE.items():
             if section not in self.settings or not isinstance(self.settings[section], dict):
                 return False
+            # The embedded SQLite backend only needs a file path, which has a default
+            if section == "database" and self.settings[section].get("backend") == "sqlite":
+                continue
             for key in keys:
                 if key not in self.settings[section]:
                     return False
@@ -76,16 +93,26 @@ class Config:
         self.settings.setdefault("github", {})
         self.settings.setdefault("email", {})
 
-        if (not self.settings["database"] or not test_database_connection(**self.settings["database"])
-                or not self.settings["fio"] or not self.settings["fio"].get("api_key")
-                or not self.settings["github"] or not test_github_access(self.settings["github"].get("repo_name", ""),
-                                                                         self.settings["github"].get("pat", ""))
-                or self.settings["email"]["enable_notifications"] is None):
+        failed = self.verify()
+        if failed:
+            if self.non_interactive:
+                raise RuntimeError(f"Configuration in {self.config_file} is incomplete or invalid "
+                                   f"({', '.join(sorted(failed))}). Run without --non-interactive to fix it.")
             print("Let's set up your configuration.")
 
 
             # Database settings (Ensure all are set and valid)
-            if not self.settings["database"] or not test_database_connection(**self.settings["database"]):
+            if "database" in failed and self.settings["database"].get("backend") == "sqlite":
+                print("\nDatabase Settings:")
+                while True:
+                    self.settings["database"]["path"] = input(
+                        f"SQLite Database File [{self.settings['database'].get('path', constants.DEFAULT_SQLITE_PATH)}]: "
+                    ) or self.settings["database"].get("path", constants.DEFAULT_SQLITE_PATH)
+                    if test_database_connection(**self.settings["database"]):
+                        print("Database connection successful!")
+                        break
+                    print("Database connection failed. Please try again.")
+            elif "database" in failed:
                 print("\nDatabase Settings:")
                 while True:
                     self.settings["database"]["host"] = input(
@@ -107,7 +134,7 @@ class Config:
                     print("Database connection failed. Please try again.")
 
             # FIO settings (Ensure API key is present and valid)
-            if not self.settings["fio"] or not self.settings["fio"].get("api_key"):
+            if "fio" in failed:
                 print("\nFIO Settings:")
                 while True:
                     self.settings["fio"]["api_key"] = input(
@@ -119,8 +146,7 @@ class Config:
                     print("Invalid FIO API Key. Please enter a valid key.")
 
             # GitHub settings (Ensure all required fields are set)
-            if not self.settings["github"] or not test_github_access(self.settings["github"].get("repo_name", ""),
-                                                                     self.settings["github"].get("pat", "")):
+            if "github" in failed:
                 print("\nGitHub Settings:")
                 self.settings["github"]["create_issues"] = input(
                     f"Automatically report bugs and exceptions? (yes/no) [{self.settings['github'].get('create_issues', False)}]: ").lower() == "yes"
@@ -137,7 +163,7 @@ class Config:
                         print("GitHub access failed. Please try again.")
 
             # Email notifications settings (Ensure optional fields are properly configured)
-            if self.settings["email"]["enable_notifications"] is None:
+            if "email" in failed:
                 print("\nEmail Notifications Settings:")
                 if not self.settings["email"].get("enable_notifications", False):
                     self.settings["email"]["enable_notifications"] = input(
@@ -174,21 +200,70 @@ class Config:
                             else:
                                 print("Incorrect verification code. Please try again.")
 
-            # Save updated settings
+            # Save updated settings, and remember that the entered credentials were just verified
             self.save()
+            self.record_verified(failed & self.PROBES.keys())
         else:
             print("Configuration file already exists. Skipping setup.")
 
+    def verify(self):
+        """
+        Check every configuration section, probing credentials over the network only when they were not
+        verified within the cache TTL. Due probes run in parallel.
+        :return: Set of section names that need to be set up again.
+        """
+        failed = set()
+        if not self.settings["database"]:
+            failed.add("database")
+        if not self.settings["fio"].get("api_key"):
+            failed.add("fio")
+        if not self.settings["github"]:
+            failed.add("github")
+        if self.settings["email"].get("enable_notifications") is None:
+            failed.add("email")
+
+        # GitHub access only matters when bug reporting is enabled
+        due = [section for section in self.PROBES if section not in failed and not self.is_recently_verified(section)
+               and (section != "github" or self.settings["github"].get("create_issues"))]
+        if due:
+            print("Testing configuration...")
+            with ThreadPoolExecutor(max_workers=len(due)) as executor:
+                results = dict(zip(due, executor.map(lambda section: self.PROBES[section](self.settings), due)))
+            for section, ok in results.items():
+                if not ok:
+                    print(f"{section.capitalize()} verification failed. Please check your settings.")
+                    failed.add(section)
+            self.record_verified(section for section, ok in results.items() if ok)
+        return failed
 
-    def test_config(self):
-        print("Testing configuration...")
-        # Test database connection
-        if not test_database_connection(**self.settings["database"]):
-            print("Database connection test failed. Please check your settings.")
-        # Test GitHub access if bug reporting is enabled
-        if self.settings["github"]["create_issues"]:
-            if not test_github_access(self.settings["github"]["repo_name"], self.settings["github"]["pat"]):
-                print("GitHub access test failed. Please check your settings.")
+    def _section_hash(self, section):
+        """Hash a settings section so cached verifications are invalidated when its values change."""
+        return hashlib.sha256(json.dumps(self.settings.get(section, {}), sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_file, 'r') as file:
+                return json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def is_recently_verified(self, section):
+        """Return True if the section's current values were verified within the TTL."""
+        entry = self._load_cache().get(section)
+        ttl = self.get("sync", "verify_ttl", constants.CONFIG_VERIFY_TTL)
+        return (entry is not None and entry.get("hash") == self._section_hash(section)
+                and time.time() - entry.get("verified_at", 0) < ttl)
+
+    def record_verified(self, sections):
+        """Record that the given sections were verified just now."""
+        cache = self._load_cache()
+        for section in sections:
+            cache[section] = {"hash": self._section_hash(section), "verified_at": time.time()}
+        try:
+            with open(self.cache_file, 'w') as file:
+                json.dump(cache, file, indent=4)
+        except OSError as e:
+            print(f"Error saving verification cache: {e}")
 
     def save(self):
         try:
@@ -3,9 +3,20 @@ import requests
 import mysql.connector
 from mysql.connector import Error
 import random
+import sqlite3
+import modules.constants as constants
 from modules.mail import send_email
 
-def test_database_connection(host, port, user, password, name):
+def test_database_connection(host="", port="", user="", password="", name="", backend="mysql", path=""):
+    if backend == "sqlite":
+        try:
+            connection = sqlite3.connect(path or constants.DEFAULT_SQLITE_PATH)
+            connection.execute("SELECT 1")
+            connection.close()
+            return True
+        except sqlite3.Error as e:
+            print(f"Database connection failed: {e}")
+        return False
     try:
         connection = mysql.connector.connect(
             host=host,
@@ -4,3 +4,72 @@ VERSION_NUM = "0.1.0"
 CODE_STATE = "release"
 VERSION = VERSION_NUM + (CODE_STATE[0] if CODE_STATE.lower() != "release" else "")
 
+# Number of rows sent per multi-row statement by the bulk sync engine
+DEFAULT_BATCH_SIZE = 1000
+
+# Number of pooled database connections
+DEFAULT_POOL_SIZE = 5
+
+# Retries for transient database errors, and the initial backoff delay in seconds (doubled on each retry)
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_DELAY = 0.5
+
+# Daemon mode: default seconds between runs of each job, and the maximum random jitter applied to each wait
+DEFAULT_JOB_INTERVAL = 3600
+DEFAULT_JOB_JITTER = 60
+DEFAULT_CATALOG_INTERVAL = 24 * 3600
+
+# File recording when each configuration section was last verified, and how long (seconds) a verification stays valid
+CONFIG_CACHE_FILE = "config_cache.json"
+CONFIG_VERIFY_TTL = 24 * 3600
+
+# Maximum number of prices and shipping quotes (an entry count, not bytes) the PriceBook keeps in memory before
+# evicting; a single material or origin with more entries than this is still cached whole
+DEFAULT_PRICEBOOK_MAX_ENTRIES = 1000000
+
+# FIO REST API: base URL, request timeout in seconds, concurrent users synced, and requests per second per API key
+FIO_BASE_URL = "https://rest.fnar.net"
+FIO_TIMEOUT = 30
+DEFAULT_FIO_WORKERS = 8
+DEFAULT_FIO_RATE_LIMIT = 2
+
+# On-disk HTTP response cache: directory, download chunk size in bytes, default TTL in seconds, and TTLs per
+# FIO endpoint class (path prefix)
+HTTP_CACHE_DIR = ".cache/http"
+HTTP_CHUNK_SIZE = 64 * 1024
+DEFAULT_HTTP_CACHE_TTL = 60
+FIO_CACHE_TTLS = {
+    "/material/": 24 * 3600,
+    "/planet/": 24 * 3600,
+    "/sites/": 15 * 60,
+    "/storage/": 5 * 60,
+    "/production/": 5 * 60,
+}
+
+# Days of consumption a planet's stock is restocked up to in the supply projection
+DEFAULT_RESTOCK_TARGET_DAYS = 14
+
+# Directory caching all-pairs shipping routes, keyed by the shipping table's sync fingerprint
+ROUTE_CACHE_DIR = ".cache/routes"
+
+# Arbitrage scan: opportunities kept per material, and the memory budget in bytes of one chunk of materials
+DEFAULT_ARBITRAGE_TOP_N = 10
+ARBITRAGE_CHUNK_BYTES = 64 * 1024 * 1024
+
+# Price history maintenance: seconds between runs, monthly partitions created ahead of time, and complete months
+# of raw history kept before they are compacted into daily OHLC rows
+DEFAULT_HISTORY_INTERVAL = 24 * 3600
+HISTORY_PARTITIONS_AHEAD = 2
+DEFAULT_HISTORY_RETAIN_MONTHS = 3
+
+# Rows fetched per request when a worksheet is read in pages (sync.page_rows enables paging)
+DEFAULT_SHEET_PAGE_ROWS = 500
+
+# Database file of the embedded SQLite backend (database.backend = "sqlite") when database.path is not set
+DEFAULT_SQLITE_PATH = "kawasync.db"
+
+# Read-only HTTP query service (--serve): default listen address and port, and the maximum number of keys one
+# batched request may ask for
+DEFAULT_SERVER_HOST = "127.0.0.1"
+DEFAULT_SERVER_PORT = 8080
+MAX_QUERY_KEYS = 1000
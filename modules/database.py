@@ -1,206 +1,197 @@
-import mysql.connector
-from mysql.connector import Error
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import islice
 from tqdm import tqdm
+import modules.constants as constants
+from modules.backends import DATABASE_ERRORS, create_backend
+from modules.metrics import InstrumentedConnection, metrics
+from modules.migrations import SCHEMA_VERSION_TABLE
+
+# Relative difference below which two FLOAT column values are considered equal
+FLOAT_TOLERANCE = 1e-6
+
+logger = logging.getLogger(__name__)
+
+
+def _cell(row, index):
+    """Return a cell of a sheet row, or "" if the row was trimmed before it."""
+    return row[index] if index < len(row) else ""
+
+
+def _values_equal(current, new):
+    """Compare two rows (or nested tuples of rows), treating FLOAT values within FLOAT_TOLERANCE as equal."""
+    if isinstance(current, (tuple, list)) and isinstance(new, (tuple, list)):
+        return len(current) == len(new) and all(_values_equal(a, b) for a, b in zip(current, new))
+    if isinstance(current, float) or isinstance(new, float):
+        return (isinstance(current, (int, float)) and isinstance(new, (int, float))
+                and math.isclose(current, new, rel_tol=FLOAT_TOLERANCE))
+    return current == new
+
 
 class Database:
-    def __init__(self, db_config):
-        # Extract database settings
-        self.host = db_config.get("host", "localhost")
-        self.port = int(db_config.get("port", 3306))
-        self.name = db_config.get("name", "")
-        self.user = db_config.get("user", "")
-        self.password = db_config.get("password", "")
-        self.connection = None
-
-        # Initialize connection and setup tables
+    def __init__(self, db_config, batch_size=constants.DEFAULT_BATCH_SIZE, pool_size=constants.DEFAULT_POOL_SIZE,
+                 max_retries=constants.DEFAULT_MAX_RETRIES):
+        # The storage engine is chosen by the "backend" setting: a MySQL server (default) or an embedded SQLite file
+        self.batch_size = int(batch_size)
+        self.pool_size = int(pool_size)
+        self.max_retries = int(max_retries)
+        self.backend = create_backend(db_config, self.pool_size)
+        self.name = self.backend.name
+        self.connected = False
+        self.listeners = []
+        self._lock = threading.Lock()
+
+        # Initialize connection pool and setup tables
         self.connect()
         self.setup_tables()
 
     def connect(self):
-        """Establish a connection to the database."""
-        try:
-            self.connection = mysql.connector.connect(
-                host=self.host,
-                port=self.port,
-                database=self.name,
-                user=self.user,
-                password=self.password
-            )
-            if self.connection.is_connected():
-                print(f"Connected to the database '{self.name}' at {self.host}:{self.port}")
-        except Error as e:
-            print(f"Error connecting to the database: {e}")
-            self.connection = None
+        """Create the backend's connection pool, unless it already exists."""
+        with self._lock:
+            if self.connected:
+                return
+            try:
+                self.backend.connect()
+                self.connected = True
+            except DATABASE_ERRORS as e:
+                print(f"Error connecting to the database: {e}")
 
     def close(self):
-        """Close the database connection."""
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
-            print("Database connection closed.")
+        """Close every idle pooled connection."""
+        with self._lock:
+            if self.connected:
+                self.backend.close()
+                self.connected = False
+                print("Database connection closed.")
 
-    def setup_tables(self):
-        """Create necessary tables if they do not exist."""
-        if not self.connection or not self.connection.is_connected():
+    @contextmanager
+    def checkout(self):
+        """
+        Check a connection out of the backend's pool for the duration of a with block.
+        Any open transaction is rolled back if the block raises.
+        :return: Context manager yielding a pooled connection.
+        """
+        if not self.connected:
             print("No active database connection. Reconnecting...")
             self.connect()
+        connection = self.backend.get_connection()
 
-        queries = [
-            """
-            CREATE TABLE IF NOT EXISTS materials (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                ticker VARCHAR(50) UNIQUE NOT NULL,
-                name VARCHAR(255) NOT NULL,
-                weight FLOAT NOT NULL,
-                volume FLOAT NOT NULL,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS planets (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                natural_id VARCHAR(255) UNIQUE NOT NULL,
-                name VARCHAR(255) NOT NULL,
-                description TEXT,
-                resource_richness JSON,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS user_data (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                prun_username VARCHAR(255) NOT NULL,
-                fio_api_key TEXT
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS user_planets (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                prun_username VARCHAR(255) NOT NULL,
-                planet_id VARCHAR(255) NOT NULL,
-                planet_natural_id VARCHAR(255) NOT NULL,
-                planet_name VARCHAR(255) NOT NULL,
-                weight_capacity FLOAT NOT NULL DEFAULT 0,
-                volume_capacity FLOAT NOT NULL DEFAULT 0,
-                weight_load FLOAT NOT NULL DEFAULT 0,
-                volume_load FLOAT NOT NULL DEFAULT 0,
-                UNIQUE KEY (prun_username, planet_id)
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS storage_materials (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                user_planet_id INT NOT NULL,
-                material_ticker VARCHAR(255) NOT NULL,
-                material_amount FLOAT NOT NULL DEFAULT 0,
-                FOREIGN KEY (user_planet_id) REFERENCES user_planets(id) ON DELETE CASCADE
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS user_warehouses (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                prun_username VARCHAR(255) NOT NULL,
-                store_id VARCHAR(255) NOT NULL,
-                location_name VARCHAR(255) NOT NULL,
-                location_natural_id VARCHAR(255) NOT NULL,
-                weight_load FLOAT NOT NULL DEFAULT 0,
-                weight_capacity FLOAT NOT NULL DEFAULT 0,
-                volume_load FLOAT NOT NULL DEFAULT 0,
-                volume_capacity FLOAT NOT NULL DEFAULT 0,
-                UNIQUE KEY (prun_username, store_id)
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS warehouse_materials (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                user_warehouse_id INT NOT NULL,
-                material_ticker VARCHAR(255) NOT NULL,
-                material_amount FLOAT NOT NULL DEFAULT 0,
-                FOREIGN KEY (user_warehouse_id) REFERENCES user_warehouses(id) ON DELETE CASCADE
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS pricing (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                mat VARCHAR(50) NOT NULL,
-                location VARCHAR(255) NOT NULL,
-                price FLOAT NOT NULL,
-                UNIQUE KEY (mat, location)
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS shipping (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                from_location VARCHAR(255) NOT NULL,
-                to_location VARCHAR(255) NOT NULL,
-                price FLOAT NOT NULL,
-                UNIQUE KEY (from_location, to_location)
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS production_lines (
-                production_line_id VARCHAR(255) PRIMARY KEY,
-                prun_username VARCHAR(255) NOT NULL,
-                planet_name VARCHAR(255) NOT NULL,
-                type VARCHAR(255) NOT NULL,
-                capacity FLOAT NOT NULL
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS production_orders (
-                order_id VARCHAR(255) PRIMARY KEY,
-                production_line_id VARCHAR(255) NOT NULL,
-                duration_ms BIGINT NOT NULL,
-                recurring BOOLEAN NOT NULL DEFAULT FALSE,
-                recipe_name VARCHAR(255) NOT NULL,
-                FOREIGN KEY (production_line_id) REFERENCES production_lines(production_line_id) ON DELETE CASCADE
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS order_inputs (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                production_order_id VARCHAR(255) NOT NULL,
-                material_name VARCHAR(255) NOT NULL,
-                material_ticker VARCHAR(255) NOT NULL,
-                material_amount FLOAT NOT NULL DEFAULT 0,
-                FOREIGN KEY (production_order_id) REFERENCES production_orders(order_id) ON DELETE CASCADE
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS order_outputs (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                production_order_id VARCHAR(255) NOT NULL,
-                material_name VARCHAR(255) NOT NULL,
-                material_ticker VARCHAR(255) NOT NULL,
-                material_amount FLOAT NOT NULL DEFAULT 0,
-                FOREIGN KEY (production_order_id) REFERENCES production_orders(order_id) ON DELETE CASCADE
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS burn_rate (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                prun_username VARCHAR(255) NOT NULL,
-                planet_natural_id VARCHAR(255) NOT NULL,
-                planet_name VARCHAR(255) NOT NULL,
-                material_ticker VARCHAR(255) NOT NULL,
-                daily_consumption FLOAT NOT NULL,
-                essential BOOLEAN NOT NULL DEFAULT FALSE
-            )
-            """
-        ]
-
-        cursor = None
         try:
-            cursor = self.connection.cursor()
-            for query in queries:
-                cursor.execute(query)
-            self.connection.commit()
-            print("Tables set up successfully.")
-        except Error as e:
-            print(f"Error setting up tables: {e}")
+            yield InstrumentedConnection(connection, metrics)
+        except Exception:
+            try:
+                connection.rollback()
+            except DATABASE_ERRORS:
+                pass
+            raise
         finally:
-            if cursor:
+            self.backend.release(connection)
+
+    def run(self, operation):
+        """
+        Run a unit of work on a pooled connection, retrying transient errors with exponential backoff.
+        The operation is retried from the start, so it should do its own commit.
+        :param operation: Callable taking a connection and returning a result.
+        :return: Whatever the operation returns.
+        """
+        attempt = 0
+        while True:
+            try:
+                with self.checkout() as connection, metrics.timer("db_operation_seconds"):
+                    return operation(connection)
+            except DATABASE_ERRORS as e:
+                if not self.backend.is_transient(e) or attempt >= self.max_retries:
+                    raise
+                metrics.inc("db_retries_total")
+                delay = constants.DEFAULT_RETRY_DELAY * 2 ** attempt
+                print(f"Transient database error: {e}. Retrying in {delay:.1f}s...")
+                time.sleep(delay)
+                attempt += 1
+
+    def add_listener(self, callback):
+        """
+        Register a callback run after each committed sync that changed a table.
+        :param callback: Callable taking (table, changes, deletes), where changes maps key tuples to new
+            values and deletes lists removed key tuples.
+        """
+        self.listeners.append(callback)
+
+    def notify_listeners(self, table, changes, deletes):
+        """Pass committed changes to every registered listener."""
+        for callback in self.listeners:
+            try:
+                callback(table, changes, deletes)
+            except Exception as e:
+                print(f"Error in sync listener for {table}: {e}")
+
+    def setup_tables(self):
+        """
+        Bring the schema up to date by applying pending migrations from modules/migrations.py.
+        When the schema is already current this costs a single version query.
+        """
+        def read_version(cursor):
+            try:
+                cursor.execute("SELECT MAX(version) FROM schema_version")
+                return cursor.fetchone()[0] or 0
+            except DATABASE_ERRORS as e:
+                if not self.backend.is_missing_table(e):
+                    raise
+                cursor.execute(SCHEMA_VERSION_TABLE)
+                return 0
+
+        migrations = self.backend.migrations
+        latest = migrations[-1][0]
+
+        def migrate(connection):
+            cursor = connection.cursor()
+            try:
+                current = read_version(cursor)
+                if current > latest:
+                    # Written by a newer release; this code may not know every table or column it relies on
+                    print(f"The database schema is at version {current}, newer than the latest migration ({latest}) "
+                          f"known to {constants.SCRIPT_NAME} v{constants.VERSION}.")
+                if current >= latest:
+                    return []
+
+                # Serialize concurrent starts, then re-check in case another process migrated meanwhile
+                self.backend.lock_migrations(cursor)
+                try:
+                    current = read_version(cursor)
+                    applied = []
+                    for version, description, statements in migrations:
+                        if version <= current:
+                            continue
+                        print(f"Applying schema migration {version}: {description}...")
+                        for statement in statements:
+                            try:
+                                cursor.execute(statement)
+                            except DATABASE_ERRORS as e:
+                                # MySQL DDL is not transactional, so a retried migration may find its changes
+                                # already made
+                                if not self.backend.is_already_applied(e):
+                                    raise
+                        cursor.execute("INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                                       (version, description))
+                        applied.append(version)
+                    # MySQL DDL commits implicitly as it goes; on SQLite this commit also releases the lock
+                    connection.commit()
+                    return applied
+                finally:
+                    self.backend.unlock_migrations(cursor)
+            finally:
                 cursor.close()
 
+        try:
+            applied = self.run(migrate)
+            if applied:
+                print(f"Schema migrated to version {applied[-1]}.")
+        except DATABASE_ERRORS as e:
+            print(f"Error setting up tables: {e}")
+
     def execute_query(self, query, params=None):
         """
         Execute a query and return the result.
@@ -208,23 +199,23 @@ class Database:
         :param params: Optional parameters for the query.
         :return: Query result or None.
         """
-        if not self.connection or not self.connection.is_connected():
-            print("No active database connection. Reconnecting...")
-            self.connect()
+        def fetch(connection):
+            cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute(query, params or {})
+                rows = cursor.fetchall()
+                connection.commit()
+                return rows
+            finally:
+                cursor.close()
 
-        cursor = None
         try:
-            cursor = self.connection.cursor(dictionary=True)
-            cursor.execute(query, params or {})
-            self.connection.commit()
-            print("Query executed successfully.")
-            return cursor.fetchall()
-        except Error as e:
-            print(f"Error executing query: {e}")
+            rows = self.run(fetch)
+            logger.debug("Query executed successfully.")
+            return rows
+        except DATABASE_ERRORS as e:
+            logger.error("Error executing query: %s", e)
             return None
-        finally:
-            if cursor:
-                cursor.close()
 
     def execute_update(self, query, params=None):
         """
@@ -232,110 +223,452 @@ class Database:
         :param query: The SQL query to execute.
         :param params: Optional parameters for the query.
         """
-        if not self.connection or not self.connection.is_connected():
-            print("No active database connection. Reconnecting...")
-            self.connect()
+        def update(connection):
+            cursor = connection.cursor()
+            try:
+                cursor.execute(query, params or {})
+                connection.commit()
+            finally:
+                cursor.close()
 
-        cursor = None
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(query, params or {})
-            self.connection.commit()
-            print("Update executed successfully.")
-        except Error as e:
-            print(f"Error executing update: {e}")
+            self.run(update)
+            logger.debug("Update executed successfully.")
+        except DATABASE_ERRORS as e:
+            logger.error("Error executing update: %s", e)
+
+    def fetch_rows(self, query, params=()):
+        """
+        Run a read query on a pooled connection, retrying transient errors.
+        Unlike execute_query, errors are raised to the caller.
+        :param query: The SQL query to execute.
+        :param params: Optional parameters for the query.
+        :return: List of row tuples.
+        """
+        def fetch(connection):
+            cursor = connection.cursor()
+            try:
+                cursor.execute(query, params)
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+
+        return self.run(fetch)
+
+    def get_sync_state(self):
+        """
+        Fetch the stored fingerprint of every sync stage.
+        :return: Dict mapping stage names to rows with content_hash and modified_time.
+        """
+        rows = self.execute_query("SELECT stage, content_hash, modified_time FROM sync_state")
+        return {row["stage"]: row for row in rows or []}
+
+    def set_sync_state(self, stage, content_hash, modified_time=None):
+        """
+        Record the fingerprint of the data a sync stage last processed.
+        :param stage: Name of the sync stage.
+        :param content_hash: Hex digest of the processed content.
+        :param modified_time: Optional source modification timestamp.
+        """
+        self.execute_update(
+            "INSERT INTO sync_state (stage, content_hash, modified_time) VALUES (%s, %s, %s) "
+            + self.backend.upsert_clause(("content_hash", "modified_time")),
+            (stage, content_hash, modified_time)
+        )
+
+    @staticmethod
+    def load_snapshot(connection, table, key_columns, value_column):
+        """
+        Load the current contents of a table into memory with a single query.
+        :param connection: Connection to read through.
+        :param table: Name of the table to read.
+        :param key_columns: Columns forming the table's unique key.
+        :param value_column: Column holding the synced value.
+        :return: Dict mapping key tuples to values.
+        """
+        cursor = connection.cursor()
+        try:
+            cursor.execute(f"SELECT {', '.join(key_columns)}, {value_column} FROM {table}")
+            return {tuple(row[:-1]): row[-1] for row in cursor.fetchall()}
         finally:
-            if cursor:
+            cursor.close()
+
+    @staticmethod
+    def diff_snapshot(snapshot, records, prune=False):
+        """
+        Compare freshly parsed records against a table snapshot.
+        FLOAT columns only keep about six significant digits, so values are compared with a relative
+        tolerance instead of exact equality to avoid rewriting the same price on every run.
+        :param snapshot: Dict of current values, as returned by load_snapshot.
+        :param records: Dict of parsed values keyed the same way.
+        :param prune: Whether keys missing from records should be reported for deletion. Ignored when records is
+            empty.
+        :return: Tuple of (inserts, updates, deletes, unchanged count).
+        """
+        inserts = {}
+        updates = {}
+        unchanged = 0
+        for key, value in records.items():
+            current = snapshot.get(key)
+            if current is None:
+                inserts[key] = value
+            elif not math.isclose(current, value, rel_tol=FLOAT_TOLERANCE):
+                updates[key] = value
+            else:
+                unchanged += 1
+
+        # An empty parse is far more likely a broken sheet than an emptied one, so it never prunes the table
+        deletes = [key for key in snapshot if key not in records] if prune and records else []
+        return inserts, updates, deletes, unchanged
+
+    def batches(self, rows):
+        """Yield successive slices of rows no larger than the configured batch size."""
+        for start in range(0, len(rows), self.batch_size):
+            yield rows[start:start + self.batch_size]
+
+    def insert_rows(self, cursor, table, columns, rows, update_columns=None):
+        """
+        Insert rows with multi-row INSERT statements of at most batch_size rows each.
+        :param cursor: Cursor of the connection (and transaction) to write through.
+        :param table: Name of the target table.
+        :param columns: Column names, in row order.
+        :param rows: List of row tuples.
+        :param update_columns: Columns to overwrite when a row's unique key already exists (upsert).
+        """
+        placeholders = f"({', '.join(['%s'] * len(columns))})"
+        suffix = ""
+        if update_columns:
+            suffix = " " + self.backend.upsert_clause(update_columns)
+        for batch in self.batches(rows):
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join([placeholders] * len(batch))}{suffix}",
+                [field for row in batch for field in row]
+            )
+            metrics.inc("rows_changed_total", len(batch), table=table, op="upsert" if update_columns else "insert")
+
+    def delete_keys(self, cursor, table, key_columns, keys):
+        """
+        Delete rows by key with batched multi-row IN statements.
+        :param cursor: Cursor of the connection (and transaction) to write through.
+        :param table: Name of the target table.
+        :param key_columns: Columns identifying a row, in key order.
+        :param keys: List of key tuples.
+        """
+        key_placeholders = f"({', '.join(['%s'] * len(key_columns))})"
+        for batch in self.batches(keys):
+            cursor.execute(
+                f"DELETE FROM {table} WHERE ({', '.join(key_columns)}) IN ({', '.join([key_placeholders] * len(batch))})",
+                [field for key in batch for field in key]
+            )
+            metrics.inc("rows_changed_total", len(batch), table=table, op="delete")
+
+    def sync_table(self, table, key_columns, value_column, records, prune=False, history_table=None):
+        """
+        Bring a keyed table in line with a set of parsed records.
+        The table is read once into memory and diffed in Python, so only real inserts, updates and
+        (when pruning) deletes are sent, each as multi-row statements in a single transaction.
+        :param table: Name of the target table.
+        :param key_columns: Columns forming the table's unique key, in record key order.
+        :param value_column: Column holding the value to keep in sync.
+        :param records: Dict mapping key tuples to values.
+        :param prune: Delete rows whose keys no longer appear in records, unless records is empty.
+        :param history_table: Optional table with the same key and value columns plus recorded_at, to which
+            every inserted or updated value is appended in the same transaction.
+        :return: Dict with inserted, updated, deleted and unchanged counts, or None on error.
+        """
+        columns = list(key_columns) + [value_column]
+
+        def sync(connection):
+            snapshot = self.load_snapshot(connection, table, key_columns, value_column)
+            inserts, updates, deletes, unchanged = self.diff_snapshot(snapshot, records, prune)
+
+            cursor = connection.cursor()
+            try:
+                # New keys are upserted too: a concurrent writer may have inserted them since the snapshot, and
+                # keys distinct in Python can collide under a case- or accent-insensitive collation
+                self.insert_rows(cursor, table, columns,
+                                 [key + (value,) for changes in (inserts, updates) for key, value in changes.items()],
+                                 update_columns=[value_column])
+                self.delete_keys(cursor, table, key_columns, deletes)
+                if history_table:
+                    recorded_at = datetime.now(timezone.utc).replace(tzinfo=None)
+                    self.insert_rows(cursor, history_table, columns + ["recorded_at"],
+                                     [key + (value, recorded_at) for changes in (inserts, updates)
+                                      for key, value in changes.items()])
+                connection.commit()
+            finally:
                 cursor.close()
+            return inserts, updates, deletes, unchanged
+
+        try:
+            inserts, updates, deletes, unchanged = self.run(sync)
+        except DATABASE_ERRORS as e:
+            print(f"Error syncing data into {table}: {e}")
+            return None
+
+        if inserts or updates or deletes:
+            self.notify_listeners(table, {**inserts, **updates}, deletes)
+        return {"inserted": len(inserts), "updated": len(updates), "deleted": len(deletes), "unchanged": unchanged}
 
-    def parse_and_update_pricing_data(self, sheet_data):
+    # Per-user storage containers: table -> (natural key column, data columns, material table, parent column)
+    STORAGE_CONTAINERS = {
+        "user_planets": ("planet_id",
+                         ("planet_natural_id", "planet_name", "weight_capacity", "volume_capacity", "weight_load",
+                          "volume_load"),
+                         "storage_materials", "user_planet_id"),
+        "user_warehouses": ("store_id",
+                            ("location_name", "location_natural_id", "weight_load", "weight_capacity", "volume_load",
+                             "volume_capacity"),
+                            "warehouse_materials", "user_warehouse_id"),
+    }
+
+    @staticmethod
+    def changed_users(fingerprints, previous, force=False):
         """
-        Parse and update pricing data in the database.
-        Only updates rows where the price has changed or new rows are detected.
-        :param sheet_data: 2D list of pricing data fetched from Google Sheets.
+        Find the users whose source fingerprint moved since their data was last built.
+        :param fingerprints: Dict mapping each username to the fingerprint of its current source data.
+        :param previous: Dict mapping usernames to the fingerprint their data was last built from.
+        :param force: Report every user in fingerprints.
+        :return: Sorted list of usernames.
         """
-        print("Parsing and updating Pricing Data...")
-        cursor = self.connection.cursor(dictionary=True)
+        return sorted(username for username, fingerprint in fingerprints.items()
+                      if force or previous.get(username) != fingerprint)
 
-        ticker = None
-        blank_row_count = 0
+    def replace_user_rows(self, table, columns, compute, fingerprints, stage_prefix, state, force=False):
+        """
+        Rebuild the rows a per-user derived table holds for every user whose source data changed.
+        Each user's <stage_prefix>:<user> sync_state entry records the fingerprint its rows were built from.
+        Changed users are processed in batches; each batch is read, computed and replaced in one transaction,
+        and its fingerprints are recorded once that transaction committed.
+        :param table: Name of the derived table, keyed by prun_username.
+        :param columns: Column names, in row order.
+        :param compute: Callable taking a cursor and a list of usernames, returning the rows of those users.
+        :param fingerprints: Dict mapping each username to the fingerprint of its source data.
+        :param stage_prefix: Prefix of the users' sync_state stages.
+        :param state: Sync state, as returned by get_sync_state.
+        :param force: Rebuild every user in fingerprints.
+        :return: List of usernames whose rows were replaced.
+        """
+        previous = {username: state.get(f"{stage_prefix}:{username}", {}).get("content_hash")
+                    for username in fingerprints}
+        changed = self.changed_users(fingerprints, previous, force)
+        if not changed:
+            print(f"Skipping {table}: no user changed since the last update.")
+            return []
 
-        # Use tqdm to display progress
-        for i, row in enumerate(tqdm(sheet_data[2:], desc="Processing Pricing Data", unit="rows"),
-                                start=3):  # Start at the 3rd row
-            if not row[1].strip():  # Skip rows without a ticker in column B
-                blank_row_count += 1
-                if blank_row_count == 2:
-                    print("Two consecutive blank rows detected. Ending parsing.")
-                    break
-                continue
-            blank_row_count = 0
+        updated = []
+        for usernames in self.batches(changed):
+            def replace(connection):
+                cursor = connection.cursor()
+                try:
+                    rows = compute(cursor, usernames)
+                    self.delete_keys(cursor, table, ("prun_username",), [(username,) for username in usernames])
+                    self.insert_rows(cursor, table, columns, rows)
+                    connection.commit()
+                    return len(rows)
+                finally:
+                    cursor.close()
 
-            ticker = row[1].strip()  # Get the ticker from column B
-            if not ticker:
+            try:
+                count = self.run(replace)
+            except Exception as e:
+                print(f"Error updating {table} for {len(usernames)} users: {e}")
                 continue
+            for username in usernames:
+                self.set_sync_state(f"{stage_prefix}:{username}", fingerprints[username])
+            updated.extend(usernames)
+            print(f"Wrote {count} {table} rows for {len(usernames)} users.")
+        return updated
 
-            locations = row[3:]  # Starting from column D
-            prices = sheet_data[i][3:]  # Prices are in the same row, starting at column D
+    def replace_user_storage(self, username, containers):
+        """
+        Replace everything stored for one user in a single transaction.
+        Containers (planets and warehouses) are upserted, containers that disappeared are deleted along with
+        their materials, and the materials of the remaining containers are rewritten with batched inserts.
+        :param username: PrUn username the storage belongs to.
+        :param containers: Dict mapping a table from STORAGE_CONTAINERS to a list of container dicts holding
+            the key column, the data columns and a "materials" dict of ticker -> amount.
+        :return: Number of material rows written, or None on error.
+        """
+        def replace(connection):
+            cursor = connection.cursor()
+            written = 0
+            try:
+                for table, (key_column, data_columns, material_table, parent_column) in self.STORAGE_CONTAINERS.items():
+                    entries = containers.get(table, [])
+                    self.insert_rows(cursor, table, ("prun_username", key_column) + data_columns,
+                                     [(username, entry[key_column]) + tuple(entry[column] for column in data_columns)
+                                      for entry in entries],
+                                     update_columns=data_columns)
 
-            for location, price in zip(locations, prices):
-                location = location.strip()
-                price = price.strip()
+                    cursor.execute(f"SELECT id, {key_column} FROM {table} WHERE prun_username = %s", (username,))
+                    ids = {key: row_id for row_id, key in cursor.fetchall()}
+                    current = {entry[key_column] for entry in entries}
+                    # Materials of vanished containers go with them through ON DELETE CASCADE
+                    self.delete_keys(cursor, table, ("id",), [(row_id,) for key, row_id in ids.items()
+                                                              if key not in current])
 
-                if not location or not price:  # Skip empty locations or prices
-                    continue
+                    kept = [(ids[entry[key_column]], entry) for entry in entries]
+                    self.delete_keys(cursor, material_table, (parent_column,), [(row_id,) for row_id, _ in kept])
+                    rows = [(row_id, ticker, amount) for row_id, entry in kept
+                            for ticker, amount in entry["materials"].items()]
+                    self.insert_rows(cursor, material_table, (parent_column, "material_ticker", "material_amount"), rows)
+                    written += len(rows)
+                connection.commit()
+            finally:
+                cursor.close()
+            return written
 
-                try:
-                    price = float(price)  # Convert price to float
-                except ValueError:
-                    print(f"Invalid price format at row {i}: {price}")
-                    continue
+        try:
+            return self.run(replace)
+        except DATABASE_ERRORS as e:
+            print(f"Error replacing storage for {username}: {e}")
+            return None
 
-                # Check if the row exists and fetch its current value
-                cursor.execute(
-                    "SELECT price FROM pricing WHERE mat = %s AND location = %s",
-                    (ticker, location)
-                )
-                existing_row = cursor.fetchone()
-
-                if existing_row:
-                    # Update only if the price has changed
-                    if existing_row["price"] != price:
-                        cursor.execute(
-                            "UPDATE pricing SET price = %s WHERE mat = %s AND location = %s",
-                            (price, ticker, location)
-                        )
-                else:
-                    # Insert new row
-                    cursor.execute(
-                        "INSERT INTO pricing (mat, location, price) VALUES (%s, %s, %s)",
-                        (ticker, location, price)
-                    )
-
-        self.connection.commit()
-        cursor.close()
-        print("Pricing data update complete.")
-
-    def parse_and_update_shipping_data(self, sheet_data):
+    def sync_user_production(self, username, lines, orders):
         """
-        Parse and update shipping data in the database.
-        Only updates rows where the price has changed or new rows are detected.
-        :param sheet_data: 2D list of shipping data fetched from Google Sheets.
+        Bring one user's production tree (lines, orders, order inputs and outputs) in line with FIO data.
+        The existing tree is read once and diffed by production_line_id and order_id. Changes are then written
+        level by level with batched statements in a single transaction, so readers never see a half-written
+        tree. Removing a line or order removes its descendants through ON DELETE CASCADE.
+        :param username: PrUn username the production lines belong to.
+        :param lines: Dict mapping production_line_id to (planet_name, type, capacity).
+        :param orders: Dict mapping order_id to (production_line_id, duration_ms, recurring, recipe_name,
+            inputs, outputs), where inputs and outputs are sorted tuples of (material_name, ticker, amount).
+        :return: Dict with counts of changed lines, orders and child rows, or None on error.
         """
-        print("Parsing and updating Shipping Data...")
-        cursor = self.connection.cursor(dictionary=True)
+        def sync(connection):
+            cursor = connection.cursor()
+            try:
+                cursor.execute("SELECT production_line_id, planet_name, type, capacity FROM production_lines "
+                               "WHERE prun_username = %s", (username,))
+                existing_lines = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
 
-        headers = sheet_data[0][1:]  # Get the "To" locations from the first row, skipping column A
+                cursor.execute("SELECT o.order_id, o.production_line_id, o.duration_ms, o.recurring, o.recipe_name "
+                               "FROM production_orders o JOIN production_lines l "
+                               "ON l.production_line_id = o.production_line_id WHERE l.prun_username = %s",
+                               (username,))
+                existing_orders = {row[0]: [row[1], row[2], bool(row[3]), row[4], [], []]
+                                   for row in cursor.fetchall()}
+                for position, child_table in ((4, "order_inputs"), (5, "order_outputs")):
+                    cursor.execute(f"SELECT c.production_order_id, c.material_name, c.material_ticker, c.material_amount "
+                                   f"FROM {child_table} c JOIN production_orders o ON o.order_id = c.production_order_id "
+                                   f"JOIN production_lines l ON l.production_line_id = o.production_line_id "
+                                   f"WHERE l.prun_username = %s", (username,))
+                    for order_id, *child in cursor.fetchall():
+                        existing_orders[order_id][position].append(tuple(child))
+                existing_orders = {order_id: tuple(order[:4]) + (tuple(sorted(order[4])), tuple(sorted(order[5])))
+                                   for order_id, order in existing_orders.items()}
+
+                # Level 1: production lines. Deleting a line cascades to its orders and their children.
+                changed_lines = [line_id for line_id, line in lines.items()
+                                 if not _values_equal(existing_lines.get(line_id), line)]
+                self.insert_rows(cursor, "production_lines",
+                                 ("production_line_id", "prun_username", "planet_name", "type", "capacity"),
+                                 [(line_id, username) + lines[line_id] for line_id in changed_lines],
+                                 update_columns=("prun_username", "planet_name", "type", "capacity"))
+                self.delete_keys(cursor, "production_lines", ("production_line_id",),
+                                 [(line_id,) for line_id in existing_lines if line_id not in lines])
+
+                # Level 2: orders whose own fields or children changed are rewritten
+                changed_orders = [order_id for order_id, order in orders.items()
+                                  if not _values_equal(existing_orders.get(order_id), order)]
+                self.delete_keys(cursor, "production_orders", ("order_id",),
+                                 [(order_id,) for order_id, order in existing_orders.items()
+                                  if order_id not in orders and order[0] in lines])
+                self.insert_rows(cursor, "production_orders",
+                                 ("order_id", "production_line_id", "duration_ms", "recurring", "recipe_name"),
+                                 [(order_id,) + orders[order_id][:4] for order_id in changed_orders],
+                                 update_columns=("production_line_id", "duration_ms", "recurring", "recipe_name"))
+
+                # Level 3: inputs and outputs of changed orders
+                child_rows = 0
+                for position, child_table in ((4, "order_inputs"), (5, "order_outputs")):
+                    self.delete_keys(cursor, child_table, ("production_order_id",),
+                                     [(order_id,) for order_id in changed_orders if order_id in existing_orders])
+                    rows = [(order_id,) + child for order_id in changed_orders for child in orders[order_id][position]]
+                    self.insert_rows(cursor, child_table,
+                                     ("production_order_id", "material_name", "material_ticker", "material_amount"),
+                                     rows)
+                    child_rows += len(rows)
+
+                connection.commit()
+                return {"lines": len(changed_lines), "orders": len(changed_orders), "children": child_rows}
+            finally:
+                cursor.close()
 
-        # Use tqdm to display progress
-        for row in tqdm(sheet_data[1:], desc="Processing Shipping Data", unit="rows"):  # Skip the header row
-            from_location = row[0].strip() if len(row) > 0 else None  # Ensure the row is not empty
+        try:
+            return self.run(sync)
+        except DATABASE_ERRORS as e:
+            print(f"Error syncing production for {username}: {e}")
+            return None
+
+    @staticmethod
+    def iter_pricing_records(rows):
+        """
+        Parse pricing rows as they are fetched, without copying or slicing them.
+        Each ticker row (ticker in column B) lists locations from column D, and the row below it holds the
+        matching prices. Parsing stops at two consecutive rows without a ticker.
+        :param rows: Iterable of sheet rows (lists of strings), starting at the first row of the sheet.
+        :return: Generator of (ticker, location, price) records.
+        """
+        rows = iter(rows)
+        for _ in range(2):  # Skip the two header rows
+            next(rows, None)
+
+        row = next(rows, None)
+        row_number = 3
+        blank_row_count = 0
+        while row is not None:
+            next_row = next(rows, None)  # Prices are in the row below the locations
+            ticker = _cell(row, 1).strip()  # Get the ticker from column B
+            if not ticker:  # Skip rows without a ticker in column B
+                blank_row_count += 1
+                if blank_row_count == 2:
+                    print("Two consecutive blank rows detected. Ending parsing.")
+                    return
+            else:
+                blank_row_count = 0
+                # Locations and prices start at column D
+                for location, price in zip(islice(row, 3, None), islice(next_row or (), 3, None)):
+                    location = location.strip()
+                    price = price.strip()
+
+                    if not location or not price:  # Skip empty locations or prices
+                        continue
+
+                    try:
+                        price = float(price)  # Convert price to float
+                    except ValueError:
+                        print(f"Invalid price format at row {row_number}: {price}")
+                        continue
+
+                    yield ticker, location, price
+            row = next_row
+            row_number += 1
+
+    @staticmethod
+    def iter_shipping_records(rows):
+        """
+        Parse shipping rows as they are fetched, without copying or slicing them.
+        The first row lists the "To" locations from column B; every other row starts with its "From" location.
+        Parsing stops at the first row without a "From" location.
+        :param rows: Iterable of sheet rows (lists of strings), starting at the first row of the sheet.
+        :return: Generator of (from_location, to_location, price) records.
+        """
+        rows = iter(rows)
+        header = next(rows, None)
+        if header is None:
+            return
+        to_locations = [location.strip() for location in islice(header, 1, None)]
+
+        for row in rows:
+            from_location = _cell(row, 0).strip()
             if not from_location:  # Stop if the "From" location is empty
                 print("Empty 'From' location detected. Ending parsing.")
-                break
+                return
 
-            for to_location, price in zip(headers, row[1:]):  # Process "To" locations and prices
-                to_location = to_location.strip()
+            for to_location, price in zip(to_locations, islice(row, 1, None)):  # Process "To" locations and prices
                 price = price.strip()
 
                 if not to_location or not price:  # Skip empty locations or prices
@@ -347,27 +680,75 @@ class Database:
                     print(f"Invalid price format for {from_location} to {to_location}: {price}")
                     continue
 
-                # Check if the row exists and fetch its current value
-                cursor.execute(
-                    "SELECT price FROM shipping WHERE from_location = %s AND to_location = %s",
-                    (from_location, to_location)
-                )
-                existing_row = cursor.fetchone()
-
-                if existing_row:
-                    # Update only if the price has changed
-                    if existing_row["price"] != price:
-                        cursor.execute(
-                            "UPDATE shipping SET price = %s WHERE from_location = %s AND to_location = %s",
-                            (price, from_location, to_location)
-                        )
-                else:
-                    # Insert new row
-                    cursor.execute(
-                        "INSERT INTO shipping (from_location, to_location, price) VALUES (%s, %s, %s)",
-                        (from_location, to_location, price)
-                    )
-
-        self.connection.commit()
-        cursor.close()
-        print("Shipping data update complete.")
\ No newline at end of file
+                yield from_location, to_location, price
+
+    @classmethod
+    def parse_pricing_data(cls, sheet_data):
+        """
+        Parse pricing data fetched from Google Sheets.
+        :param sheet_data: Iterable of pricing rows, either a full sheet or a paged row stream.
+        :return: Dict mapping (ticker, location) to price.
+        """
+        rows = tqdm(sheet_data, desc="Processing Pricing Data", unit="rows")
+        return {(ticker, location): price for ticker, location, price in cls.iter_pricing_records(rows)}
+
+    @classmethod
+    def parse_shipping_data(cls, sheet_data):
+        """
+        Parse shipping data fetched from Google Sheets.
+        :param sheet_data: Iterable of shipping rows, either a full sheet or a paged row stream.
+        :return: Dict mapping (from_location, to_location) to price.
+        """
+        rows = tqdm(sheet_data, desc="Processing Shipping Data", unit="rows")
+        return {(from_location, to_location): price
+                for from_location, to_location, price in cls.iter_shipping_records(rows)}
+
+    def update_pricing_data(self, records, prune=False):
+        """
+        Sync parsed pricing records into the database.
+        Only updates rows where the price has changed or new rows are detected.
+        :param records: Dict mapping (ticker, location) to price, as returned by parse_pricing_data.
+        :param prune: Delete rows that no longer appear in the sheet.
+        :return: Dict with inserted, updated, deleted and unchanged counts, or None on error.
+        """
+        result = self.sync_table("pricing", ("mat", "location"), "price", records, prune=prune,
+                                 history_table="pricing_history")
+        if result is not None:
+            print(f"Pricing data update complete: {result['inserted']} inserted, "
+                  f"{result['updated']} updated, {result['deleted']} deleted, {result['unchanged']} unchanged.")
+        return result
+
+    def update_shipping_data(self, records, prune=False):
+        """
+        Sync parsed shipping records into the database.
+        Only updates rows where the price has changed or new rows are detected.
+        :param records: Dict mapping (from_location, to_location) to price, as returned by parse_shipping_data.
+        :param prune: Delete rows that no longer appear in the sheet.
+        :return: Dict with inserted, updated, deleted and unchanged counts, or None on error.
+        """
+        result = self.sync_table("shipping", ("from_location", "to_location"), "price", records, prune=prune,
+                                 history_table="shipping_history")
+        if result is not None:
+            print(f"Shipping data update complete: {result['inserted']} inserted, "
+                  f"{result['updated']} updated, {result['deleted']} deleted, {result['unchanged']} unchanged.")
+        return result
+
+    def parse_and_update_pricing_data(self, sheet_data, prune=False):
+        """
+        Parse and update pricing data in the database.
+        :param sheet_data: Iterable of pricing rows fetched from Google Sheets.
+        :param prune: Delete rows that no longer appear in the sheet.
+        :return: Dict with inserted, updated, deleted and unchanged counts, or None on error.
+        """
+        print("Parsing and updating Pricing Data...")
+        return self.update_pricing_data(self.parse_pricing_data(sheet_data), prune=prune)
+
+    def parse_and_update_shipping_data(self, sheet_data, prune=False):
+        """
+        Parse and update shipping data in the database.
+        :param sheet_data: Iterable of shipping rows fetched from Google Sheets.
+        :param prune: Delete rows that no longer appear in the sheet.
+        :return: Dict with inserted, updated, deleted and unchanged counts, or None on error.
+        """
+        print("Parsing and updating Shipping Data...")
+        return self.update_shipping_data(self.parse_shipping_data(sheet_data), prune=prune)
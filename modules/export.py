@@ -0,0 +1,206 @@
+import csv
+import gzip
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+import modules.constants as constants
+from modules.fileutil import write_atomic
+from modules.metrics import metrics
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Exported tables: name -> (sync_state stage the table is fingerprinted by, or the prefix of the per-user stages
+# partitioning it; query, with a %s for the user of a partition; (column, type) pairs)
+EXPORT_TABLES = {
+    "pricing": ("pricing", "SELECT mat, location, price FROM pricing ORDER BY mat, location",
+                (("mat", "string"), ("location", "string"), ("price", "float64"))),
+    "shipping": ("shipping",
+                 "SELECT from_location, to_location, price FROM shipping ORDER BY from_location, to_location",
+                 (("from_location", "string"), ("to_location", "string"), ("price", "float64"))),
+    "storage_materials": ("fio_storage:",
+                          "SELECT p.prun_username, p.planet_natural_id, p.planet_name, m.material_ticker, "
+                          "m.material_amount FROM storage_materials m JOIN user_planets p ON p.id = m.user_planet_id "
+                          "WHERE p.prun_username = %s ORDER BY p.planet_natural_id, m.material_ticker",
+                          (("prun_username", "string"), ("planet_natural_id", "string"), ("planet_name", "string"),
+                           ("material_ticker", "string"), ("material_amount", "float64"))),
+    "burn_rate": ("burn_rate:",
+                  "SELECT prun_username, planet_natural_id, planet_name, material_ticker, daily_consumption, essential "
+                  "FROM burn_rate WHERE prun_username = %s ORDER BY planet_natural_id, material_ticker",
+                  (("prun_username", "string"), ("planet_natural_id", "string"), ("planet_name", "string"),
+                   ("material_ticker", "string"), ("daily_consumption", "float64"), ("essential", "bool"))),
+}
+
+# Snapshot formats and their file extensions; Arrow IPC files can be memory-mapped without deserializing
+EXPORT_FORMATS = {
+    "arrow": ".arrow",
+    "parquet": ".parquet",
+    "csv": ".csv.gz",
+}
+
+MANIFEST_FILE = "manifest.json"
+
+
+def default_format():
+    """Return the best snapshot format available: Arrow IPC with pyarrow installed, compressed CSV otherwise."""
+    return "arrow" if pa is not None else "csv"
+
+
+def _arrow_table(columns, rows):
+    types = {"string": pa.string(), "float64": pa.float64(), "bool": pa.bool_()}
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    arrays = [pa.array([bool(value) for value in column] if kind == "bool" else column, type=types[kind])
+              for (_, kind), column in zip(columns, values)]
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def write_snapshot(path, file_format, columns, rows):
+    """
+    Write rows to a snapshot file in the given format.
+    :param path: Destination path, including the format's extension.
+    :param file_format: Key of EXPORT_FORMATS.
+    :param columns: (column, type) pairs, in row order.
+    :param rows: List of row tuples.
+    """
+    if file_format == "csv":
+        with gzip.open(path, 'wt', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow([name for name, _ in columns])
+            writer.writerows(rows)
+        return
+    if pa is None:
+        raise RuntimeError(f"The {file_format} snapshot format requires pyarrow.")
+    table = _arrow_table(columns, rows)
+    if file_format == "parquet":
+        pq.write_table(table, path, compression="zstd")
+    else:
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+class SnapshotExporter:
+    """
+    Columnar snapshots of the synced tables, so analytic reads can run off the files instead of the database.
+    Every table is split into partitions: a single one for pricing and shipping, one per user for the per-user
+    tables. A partition is only re-exported when the sync fingerprint it was exported under moved, and each
+    export run writes its files under a new version number next to the previous ones. manifest.json, replaced
+    atomically after the files are written, names the current file of every partition; files it no longer
+    references are deleted afterwards.
+    """
+
+    def __init__(self, db, export_dir, file_format=None):
+        """
+        :param db: Database instance to read from.
+        :param export_dir: Directory holding the snapshot files and manifest.
+        :param file_format: Key of EXPORT_FORMATS; defaults to default_format().
+        """
+        file_format = file_format or default_format()
+        if file_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format '{file_format}'; expected one of {', '.join(EXPORT_FORMATS)}.")
+        if file_format != "csv" and pa is None:
+            print(f"pyarrow is not installed; exporting compressed CSV instead of {file_format}.")
+            file_format = "csv"
+        self.db = db
+        self.export_dir = export_dir
+        self.file_format = file_format
+        self._lock = threading.Lock()
+        os.makedirs(export_dir, exist_ok=True)
+
+    def _manifest_path(self):
+        return os.path.join(self.export_dir, MANIFEST_FILE)
+
+    def load_manifest(self):
+        """Return the current manifest, or an empty one if none was written yet."""
+        try:
+            with open(self._manifest_path(), 'r') as file:
+                return json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return {"version": 0, "tables": {}}
+
+    @staticmethod
+    def _partitions(state, stage):
+        """Map each partition of a table to (directory, query parameters, fingerprint) from the sync state."""
+        if not stage.endswith(":"):
+            entry = state.get(stage)
+            return {"": ("", (), entry["content_hash"])} if entry else {}
+        partitions = {}
+        for name, entry in state.items():
+            if name.startswith(stage):
+                username = name[len(stage):]
+                partitions[username] = (f"prun_username={quote(username, safe='')}", (username,), entry["content_hash"])
+        return partitions
+
+    def _remove_unreferenced(self, manifest):
+        """Delete snapshot files the manifest no longer references."""
+        referenced = {os.path.normpath(partition["path"]) for table in manifest["tables"].values()
+                      for partition in table["partitions"].values()}
+        for table in EXPORT_TABLES:
+            for directory, _, files in os.walk(os.path.join(self.export_dir, table)):
+                for name in files:
+                    path = os.path.join(directory, name)
+                    if os.path.normpath(os.path.relpath(path, self.export_dir)) not in referenced:
+                        os.remove(path)
+
+    @metrics.timed_stage("export")
+    def export(self, force=False):
+        """
+        Export every partition whose sync fingerprint changed since it was last exported.
+        :param force: Re-export every partition.
+        :return: Number of partition files written, or None if the export failed.
+        """
+        with self._lock:
+            manifest = self.load_manifest()
+            version = manifest["version"] + 1
+            extension = EXPORT_FORMATS[self.file_format]
+            state = self.db.get_sync_state()
+            tables = {}
+            written = 0
+            try:
+                for table, (stage, query, columns) in EXPORT_TABLES.items():
+                    previous = manifest["tables"].get(table, {}).get("partitions", {})
+                    partitions = {}
+                    for key, (directory, params, fingerprint) in self._partitions(state, stage).items():
+                        current = previous.get(key)
+                        if (not force and current and current["fingerprint"] == fingerprint
+                                and current["path"].endswith(extension)):
+                            partitions[key] = current
+                            continue
+                        rows = self.db.fetch_rows(query, params)
+                        path = os.path.join(table, directory, f"part-v{version}{extension}")
+                        full_path = os.path.join(self.export_dir, path)
+                        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                        write_atomic(full_path, lambda temp_path: write_snapshot(temp_path, self.file_format,
+                                                                                  columns, rows))
+                        partitions[key] = {"path": path, "fingerprint": fingerprint, "rows": len(rows),
+                                           "version": version}
+                        written += 1
+                    tables[table] = {"columns": [{"name": name, "type": kind} for name, kind in columns],
+                                     "partitions": partitions}
+            except Exception as e:
+                print(f"Error exporting snapshots: {e}")
+                return None
+
+            removed = any(set(manifest["tables"].get(table, {}).get("partitions", {}))
+                          - set(tables[table]["partitions"]) for table in tables)
+            if not written and not removed:
+                print("Skipping snapshot export: no table changed since the last export.")
+                return 0
+
+            manifest = {
+                "version": version,
+                "format": self.file_format,
+                "exported_at": datetime.now(timezone.utc).isoformat(),
+                "generator": f"{constants.SCRIPT_NAME} v{constants.VERSION}",
+                "tables": tables,
+            }
+            write_atomic(self._manifest_path(), json.dumps(manifest, indent=2))
+            self._remove_unreferenced(manifest)
+            print(f"Exported snapshot version {version}: {written} partition files written.")
+            return written
@@ -0,0 +1,24 @@
+import os
+import threading
+
+
+def write_atomic(path, writer):
+    """
+    Replace a file atomically: the content is written to a temporary file next to it, which is then renamed over
+    the target, so readers only ever see the old or the new file, never a partial one.
+    :param path: File to write.
+    :param writer: Content to write (str or bytes), or a callable writing the content to the temporary path it is
+        given.
+    """
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        if callable(writer):
+            writer(temp_path)
+        else:
+            with open(temp_path, 'wb' if isinstance(writer, bytes) else 'w') as file:
+                file.write(writer)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
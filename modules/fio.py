@@ -0,0 +1,209 @@
+import hashlib
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import modules.constants as constants
+from modules.http_cache import HttpCache, RateLimiter
+from modules.metrics import metrics
+
+
+class FioClient:
+    """A small client for the FIO REST API, shared by every sync worker."""
+
+    def __init__(self, rate_limit=constants.DEFAULT_FIO_RATE_LIMIT, base_url=constants.FIO_BASE_URL,
+                 cache_dir=constants.HTTP_CACHE_DIR):
+        """
+        Initialize the client.
+        :param rate_limit: Maximum requests per second made with any one API key.
+        :param base_url: FIO REST API base URL.
+        :param cache_dir: Directory of the on-disk response cache.
+        """
+        self.base_url = base_url
+        self.http = HttpCache(cache_dir=cache_dir, rate_limiter=RateLimiter(rate_limit))
+
+    def get(self, path, api_key):
+        """
+        Fetch a JSON endpoint through the response cache.
+        :param path: Endpoint path, e.g. "/storage/username".
+        :param api_key: FIO API key to authenticate with.
+        :return: CachedResponse; call json() to decode it.
+        """
+        return self.http.get(f"{self.base_url}{path}", api_key=api_key, headers={"accept": "application/json"})
+
+
+def _materials(store):
+    """Sum the material amounts held in a FIO store by ticker."""
+    materials = defaultdict(float)
+    for item in (store or {}).get("StorageItems") or []:
+        if item.get("MaterialTicker"):
+            materials[item["MaterialTicker"]] += item.get("MaterialAmount") or 0
+    return dict(materials)
+
+
+def build_storage(sites, stores, warehouses):
+    """
+    Turn FIO site, storage and warehouse responses into containers for Database.replace_user_storage.
+    Base stores are matched to sites by AddressableId and warehouse stores to warehouses by StoreId.
+    :return: Dict with "user_planets" and "user_warehouses" container lists.
+    """
+    stores_by_address = {store.get("AddressableId"): store for store in stores if store.get("Type") == "STORE"}
+    stores_by_id = {store.get("StorageId"): store for store in stores}
+
+    planets = []
+    for site in sites:
+        store = stores_by_address.get(site.get("SiteId")) or {}
+        planets.append({
+            "planet_id": site["PlanetId"],
+            "planet_natural_id": site.get("PlanetIdentifier") or "",
+            "planet_name": site.get("PlanetName") or "",
+            "weight_capacity": store.get("WeightCapacity") or 0,
+            "volume_capacity": store.get("VolumeCapacity") or 0,
+            "weight_load": store.get("WeightLoad") or 0,
+            "volume_load": store.get("VolumeLoad") or 0,
+            "materials": _materials(store),
+        })
+
+    user_warehouses = []
+    for warehouse in warehouses:
+        store = stores_by_id.get(warehouse.get("StoreId")) or {}
+        user_warehouses.append({
+            "store_id": warehouse["StoreId"],
+            "location_name": warehouse.get("LocationName") or "",
+            "location_natural_id": warehouse.get("LocationNaturalId") or "",
+            "weight_load": store.get("WeightLoad") or 0,
+            "weight_capacity": store.get("WeightCapacity") or warehouse.get("WeightCapacity") or 0,
+            "volume_load": store.get("VolumeLoad") or 0,
+            "volume_capacity": store.get("VolumeCapacity") or warehouse.get("VolumeCapacity") or 0,
+            "materials": _materials(store),
+        })
+
+    return {"user_planets": planets, "user_warehouses": user_warehouses}
+
+
+def sync_user_storage(db, client, username, api_key, previous_hash=None):
+    """
+    Fetch one user's sites, stores and warehouses from FIO and replace their storage rows.
+    When the responses are identical to those of the last successful sync, nothing is parsed or written.
+    :param previous_hash: Fingerprint stored by the last successful sync of this user.
+    :return: "updated", "unchanged" or "failed".
+    """
+    responses = [client.get(path, api_key)
+                 for path in (f"/sites/{username}", f"/storage/{username}", f"/sites/warehouses/{username}")]
+    content_hash = hashlib.sha256("".join(response.body_hash for response in responses).encode("utf-8")).hexdigest()
+    if content_hash == previous_hash:
+        return "unchanged"
+
+    sites, stores, warehouses = (response.json() for response in responses)
+    if db.replace_user_storage(username, build_storage(sites, stores, warehouses)) is None:
+        return "failed"
+    db.set_sync_state(f"fio_storage:{username}", content_hash)
+    return "updated"
+
+
+def _order_materials(materials):
+    """Turn FIO order inputs or outputs into a sorted tuple of (material_name, ticker, amount)."""
+    return tuple(sorted(
+        (material.get("MaterialName") or material["MaterialTicker"], material["MaterialTicker"],
+         material.get("MaterialAmount") or 0)
+        for material in materials or [] if material.get("MaterialTicker")
+    ))
+
+
+def build_production(production_lines):
+    """
+    Turn a FIO production response into the line and order trees for Database.sync_user_production.
+    :return: Tuple of (lines, orders) dicts keyed by production_line_id and order_id.
+    """
+    lines = {}
+    orders = {}
+    for line in production_lines:
+        line_id = line["ProductionLineId"]
+        lines[line_id] = (line.get("PlanetName") or "", line.get("Type") or "", line.get("Capacity") or 0)
+        for order in line.get("Orders") or []:
+            orders[order["ProductionLineOrderId"]] = (
+                line_id,
+                int(order.get("DurationMs") or 0),
+                bool(order.get("Recurring")),
+                order.get("StandardRecipeName") or "",
+                _order_materials(order.get("Inputs")),
+                _order_materials(order.get("Outputs")),
+            )
+    return lines, orders
+
+
+def sync_user_production(db, client, username, api_key, previous_hash=None):
+    """
+    Fetch one user's production lines from FIO and sync their line, order and order material rows.
+    When the response is identical to that of the last successful sync, nothing is parsed or written.
+    :param previous_hash: Fingerprint stored by the last successful sync of this user.
+    :return: "updated", "unchanged" or "failed".
+    """
+    response = client.get(f"/production/{username}", api_key)
+    if response.body_hash == previous_hash:
+        return "unchanged"
+
+    lines, orders = build_production(response.json())
+    if db.sync_user_production(username, lines, orders) is None:
+        return "failed"
+    db.set_sync_state(f"production:{username}", response.body_hash)
+    return "updated"
+
+
+def get_fio_users(db):
+    """
+    Fetch every user with a FIO API key.
+    :return: List of (prun_username, fio_api_key) tuples.
+    """
+    rows = db.execute_query(
+        "SELECT prun_username, fio_api_key FROM user_data WHERE fio_api_key IS NOT NULL AND fio_api_key <> ''"
+    )
+    return [(row["prun_username"], row["fio_api_key"]) for row in rows or []]
+
+
+def run_user_sync(db, client, label, state_prefix, sync_user, workers=constants.DEFAULT_FIO_WORKERS):
+    """
+    Run a per-user FIO sync for every user in user_data through a bounded worker pool.
+    Each user is written in its own transaction, so one failing user does not affect the others.
+    :param db: Database instance to write to.
+    :param client: FioClient to fetch with.
+    :param label: Name of the synced data, used in log messages.
+    :param state_prefix: sync_state stage prefix holding each user's last fingerprint.
+    :param sync_user: Callable taking (db, client, username, api_key, previous_hash) and returning an outcome.
+    :param workers: Maximum number of users synced at once.
+    :return: Counter of outcomes.
+    """
+    users = get_fio_users(db)
+    if not users:
+        print("No FIO users to sync.")
+        return Counter()
+
+    print(f"Syncing FIO {label} for {len(users)} users...")
+    state = db.get_sync_state()
+    outcomes = Counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(sync_user, db, client, username, api_key,
+                            state.get(f"{state_prefix}:{username}", {}).get("content_hash")): username
+            for username, api_key in users
+        }
+        for future in as_completed(futures):
+            try:
+                outcomes[future.result()] += 1
+            except Exception as e:
+                print(f"FIO {label} sync failed for {futures[future]}: {e}")
+                outcomes["failed"] += 1
+    print(f"FIO {label} sync complete: {outcomes['updated']} updated, {outcomes['unchanged']} unchanged, "
+          f"{outcomes['failed']} failed.")
+    return outcomes
+
+
+@metrics.timed_stage("fio_storage")
+def run_storage_sync(db, client, workers=constants.DEFAULT_FIO_WORKERS):
+    """Sync FIO storage for every user in user_data. See run_user_sync."""
+    return run_user_sync(db, client, "storage", "fio_storage", sync_user_storage, workers=workers)
+
+
+@metrics.timed_stage("fio_production")
+def run_production_sync(db, client, workers=constants.DEFAULT_FIO_WORKERS):
+    """Sync FIO production lines and orders for every user in user_data. See run_user_sync."""
+    return run_user_sync(db, client, "production", "production", sync_user_production, workers=workers)
@@ -1,5 +1,8 @@
 import gspread
+from gspread.utils import absolute_range_name
 from oauth2client.service_account import ServiceAccountCredentials
+import modules.constants as constants
+from modules.metrics import metrics
 
 class GoogleSheets:
     """A class for interacting with Google Sheets."""
@@ -12,6 +15,41 @@ class GoogleSheets:
         """
         self.credentials_file = credentials_file
         self.file_id = file_id
+        self.spreadsheet = None
+
+    def open_spreadsheet(self):
+        """Authorize with the service account and open the configured spreadsheet, reusing the handle."""
+        if self.spreadsheet is None:
+            # Setup Google Sheets API scope and credentials
+            scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+            creds = ServiceAccountCredentials.from_json_keyfile_name(self.credentials_file, scope)
+            client = gspread.authorize(creds)
+            self.spreadsheet = client.open_by_key(self.file_id)
+        return self.spreadsheet
+
+    def fetch_sheets(self, sheet_names):
+        """
+        Fetch several worksheets in a single batched API request.
+        :param sheet_names: Names of the worksheets to fetch.
+        :return: Dict mapping each worksheet name to a 2D list of its values.
+        """
+        sheet_names = list(sheet_names)
+        if not sheet_names:
+            return {}
+        try:
+            spreadsheet = self.open_spreadsheet()
+            with metrics.timer("http_request_seconds", service="sheets"):
+                response = spreadsheet.values_batch_get(
+                    [absolute_range_name(sheet_name) for sheet_name in sheet_names]
+                )
+            print(f"Fetched Worksheets: {', '.join(sheet_names)}")
+            # Rows come back without trailing empty cells; the parsers treat missing cells as empty
+            return {
+                sheet_name: value_range.get("values", [])
+                for sheet_name, value_range in zip(sheet_names, response.get("valueRanges", []))
+            }
+        except Exception as e:
+            raise RuntimeError(f"Error fetching Google Sheets data for {', '.join(sheet_names)}: {e}")
 
     def fetch_data(self, sheet_name):
         """
@@ -19,15 +57,51 @@ class GoogleSheets:
         :param sheet_name: Name of the worksheet to fetch data from.
         :return: 2D list representing sheet data.
         """
+        return self.fetch_sheets([sheet_name])[sheet_name]
+
+    def iter_rows(self, sheet_name, page_rows=constants.DEFAULT_SHEET_PAGE_ROWS):
+        """
+        Fetch a worksheet in pages of rows, yielding rows as each page arrives.
+        Only one page is held at a time, and pages after the point where the consumer stops are never fetched.
+        Rows are yielded exactly as fetch_sheets returns them, including empty rows between data rows.
+        :param sheet_name: Name of the worksheet to fetch.
+        :param page_rows: Number of rows fetched per request.
+        :return: Generator of rows (lists of strings).
+        """
         try:
-            # Setup Google Sheets API scope and credentials
-            scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-            creds = ServiceAccountCredentials.from_json_keyfile_name(self.credentials_file, scope)
-            client = gspread.authorize(creds)
+            spreadsheet = self.open_spreadsheet()
+            row_count = spreadsheet.worksheet(sheet_name).row_count
+        except Exception as e:
+            raise RuntimeError(f"Error opening Google Sheets worksheet {sheet_name}: {e}")
+
+        blank_rows = 0  # Empty rows are held back until a data row follows, as trailing ones are trimmed
+        for start in range(1, row_count + 1, page_rows):
+            end = min(start + page_rows - 1, row_count)
+            try:
+                with metrics.timer("http_request_seconds", service="sheets"):
+                    response = spreadsheet.values_get(absolute_range_name(sheet_name, f"{start}:{end}"))
+                values = response.get("values", [])
+            except Exception as e:
+                raise RuntimeError(f"Error fetching rows {start}-{end} of {sheet_name}: {e}")
+            for row in values:
+                if not row:
+                    blank_rows += 1
+                    continue
+                for _ in range(blank_rows):
+                    yield []
+                blank_rows = 0
+                yield row
+            blank_rows += end - start + 1 - len(values)
 
-            # Open the worksheet and fetch all values
-            sheet = client.open_by_key(self.file_id).worksheet(sheet_name)
-            print(f"Opened Worksheet: {sheet_name}")
-            return sheet.get_all_values()
+    def get_modified_time(self):
+        """
+        Fetch the Drive modifiedTime of the spreadsheet.
+        :return: RFC 3339 timestamp string, or None if it could not be fetched.
+        """
+        try:
+            spreadsheet = self.open_spreadsheet()
+            with metrics.timer("http_request_seconds", service="drive"):
+                return spreadsheet.get_lastUpdateTime()
         except Exception as e:
-            raise RuntimeError(f"Error fetching Google Sheets data for {sheet_name}: {e}")
+            print(f"Could not fetch spreadsheet modified time: {e}")
+            return None
@@ -0,0 +1,147 @@
+import re
+from datetime import date, datetime, timezone
+
+import modules.constants as constants
+from modules.metrics import metrics
+
+# History tables: raw history table -> (daily OHLC table, key columns)
+HISTORY_TABLES = {
+    "pricing_history": ("pricing_daily", ("mat", "location")),
+    "shipping_history": ("shipping_daily", ("from_location", "to_location")),
+}
+
+# Monthly partitions are named pYYYYMM and hold rows recorded before the first day of the following month
+_PARTITION_NAME = re.compile(r"^p(\d{4})(\d{2})$")
+
+
+def _add_months(month, count):
+    """Return the first day of the month `count` months after `month`."""
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _current_month():
+    today = datetime.now(timezone.utc).date()
+    return date(today.year, today.month, 1)
+
+
+def _partition_months(cursor, table):
+    """Return the months of a table's existing monthly partitions, in order."""
+    cursor.execute("SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+                   "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL", (table,))
+    months = []
+    for (name,) in cursor.fetchall():
+        match = _PARTITION_NAME.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def ensure_partitions(cursor, table, months_ahead=constants.HISTORY_PARTITIONS_AHEAD):
+    """
+    Split monthly partitions off the catch-all p_future partition up to months_ahead months from now.
+    :return: Number of partitions created.
+    """
+    months = _partition_months(cursor, table)
+    first = _add_months(months[-1], 1) if months else _current_month()
+    last = _add_months(_current_month(), months_ahead)
+    new_months = []
+    while first <= last:
+        new_months.append(first)
+        first = _add_months(first, 1)
+    if not new_months:
+        return 0
+
+    partitions = [f"PARTITION p{month:%Y%m} VALUES LESS THAN (TO_DAYS('{_add_months(month, 1):%Y-%m-%d}'))"
+                  for month in new_months]
+    cursor.execute(f"ALTER TABLE {table} REORGANIZE PARTITION p_future INTO "
+                   f"({', '.join(partitions)}, PARTITION p_future VALUES LESS THAN MAXVALUE)")
+    return len(new_months)
+
+
+def _rollup(cursor, table, source, params, upsert_clause):
+    """
+    Upsert daily OHLC rows computed from the raw history rows selected by source.
+    :param source: FROM clause remainder selecting the raw rows, e.g. a partition or a WHERE condition.
+    :param upsert_clause: The backend's upsert suffix for the OHLC columns.
+    """
+    daily_table, key_columns = HISTORY_TABLES[table]
+    keys = ", ".join(key_columns)
+    cursor.execute(
+        f"INSERT INTO {daily_table} ({keys}, day, open, high, low, close, samples) "
+        f"SELECT {keys}, day, MAX(CASE WHEN first_rank = 1 THEN price END), MAX(price), MIN(price), "
+        f"MAX(CASE WHEN last_rank = 1 THEN price END), COUNT(*) "
+        f"FROM (SELECT {keys}, price, DATE(recorded_at) AS day, "
+        f"ROW_NUMBER() OVER (PARTITION BY {keys}, DATE(recorded_at) ORDER BY recorded_at) AS first_rank, "
+        f"ROW_NUMBER() OVER (PARTITION BY {keys}, DATE(recorded_at) ORDER BY recorded_at DESC) AS last_rank "
+        f"FROM {table} {source}) ranked "
+        f"GROUP BY {keys}, day {upsert_clause}",
+        params
+    )
+
+
+def compact_partition(cursor, table, month, upsert_clause):
+    """
+    Downsample one monthly partition into daily OHLC rows, then drop it.
+    The rollup is an upsert, so running it again after an interruption before the drop is harmless.
+    """
+    partition = f"p{month:%Y%m}"
+    _rollup(cursor, table, f"PARTITION ({partition})", (), upsert_clause)
+    # DDL commits implicitly, so the rollup is committed before the raw rows are dropped
+    cursor.execute(f"ALTER TABLE {table} DROP PARTITION {partition}")
+
+
+def compact_before(cursor, table, cutoff, upsert_clause):
+    """
+    Downsample every raw row recorded before cutoff into daily OHLC rows, then delete them.
+    Used on backends without partitioning; the caller commits both statements as one transaction.
+    :return: Number of raw rows deleted.
+    """
+    _rollup(cursor, table, "WHERE recorded_at < %s", (cutoff,), upsert_clause)
+    cursor.execute(f"DELETE FROM {table} WHERE recorded_at < %s", (cutoff,))
+    return cursor.rowcount
+
+
+@metrics.timed_stage("history")
+def maintain_history(db, retain_months=constants.DEFAULT_HISTORY_RETAIN_MONTHS,
+                     months_ahead=constants.HISTORY_PARTITIONS_AHEAD):
+    """
+    Keep the price history tables small: create upcoming monthly partitions, and compact every complete month
+    older than retain_months into the daily OHLC tables before dropping its partition.
+    Dropping a partition is a metadata operation, so expiring a month costs the same whatever its size.
+    Backends without partitioning compact and delete everything recorded before the same cutoff instead.
+    :param db: Database instance to maintain.
+    :param retain_months: Complete months of raw history to keep.
+    :param months_ahead: Months of partitions to create ahead of the current one.
+    """
+    cutoff = _add_months(_current_month(), -retain_months)
+    upsert_clause = db.backend.upsert_clause(("open", "high", "low", "close", "samples"))
+    partitioned = db.backend.supports_partitions
+    for table in HISTORY_TABLES:
+        def maintain(connection):
+            cursor = connection.cursor()
+            try:
+                if not partitioned:
+                    deleted = compact_before(cursor, table, cutoff, upsert_clause)
+                    connection.commit()
+                    return deleted
+                created = ensure_partitions(cursor, table, months_ahead)
+                compacted = 0
+                for month in _partition_months(cursor, table):
+                    if _add_months(month, 1) > cutoff:
+                        break
+                    compact_partition(cursor, table, month, upsert_clause)
+                    compacted += 1
+                return created, compacted
+            finally:
+                cursor.close()
+
+        try:
+            result = db.run(maintain)
+        except Exception as e:
+            print(f"Error maintaining {table}: {e}")
+            continue
+        if partitioned:
+            print(f"Maintained {table}: {result[0]} partitions created, {result[1]} months compacted.")
+        else:
+            print(f"Maintained {table}: {result} rows recorded before {cutoff} compacted.")
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import requests
+
+import modules.constants as constants
+from modules.fileutil import write_atomic
+from modules.metrics import metrics
+
+
+class RateLimiter:
+    """Spaces out calls made with the same key to at most `rate` per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_allowed = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def wait(self, key):
+        """Block until a call with this key is allowed."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self.next_allowed[key])
+            self.next_allowed[key] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class CachedResponse:
+    """A GET response body stored in the on-disk cache, whether it was just downloaded or reused."""
+
+    def __init__(self, url, path, body_hash):
+        """
+        :param url: Requested URL.
+        :param path: Path of the cached body file.
+        :param body_hash: SHA-256 hex digest of the body.
+        """
+        self.url = url
+        self.path = path
+        self.body_hash = body_hash
+
+    @property
+    def body(self):
+        """Read the raw body."""
+        with open(self.path, 'rb') as file:
+            return file.read()
+
+    def json(self):
+        """Decode the body as JSON."""
+        with open(self.path, 'rb') as file:
+            return json.load(file)
+
+    def open(self):
+        """Open the body as UTF-8 text, for streaming parsers."""
+        return open(self.path, 'r', encoding="utf-8")
+
+
+class HttpCache:
+    """
+    A keep-alive HTTP client with an on-disk response cache.
+    Responses are cached per URL and API key. Within an endpoint's TTL the cached body is returned without
+    a request; after it, a conditional GET (If-None-Match / If-Modified-Since) revalidates the cached body.
+    """
+
+    def __init__(self, cache_dir=constants.HTTP_CACHE_DIR, ttls=None, rate_limiter=None):
+        """
+        :param cache_dir: Directory holding cached bodies and their metadata.
+        :param ttls: Dict mapping URL path prefixes to TTLs in seconds. The longest matching prefix wins.
+        :param rate_limiter: Optional RateLimiter applied per API key to requests that reach the network.
+        """
+        self.cache_dir = cache_dir
+        self.ttls = constants.FIO_CACHE_TTLS if ttls is None else ttls
+        self.rate_limiter = rate_limiter
+        self.session = requests.Session()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def ttl_for(self, url):
+        """Return the TTL of the longest configured prefix matching the URL's path."""
+        path = urlparse(url).path
+        matches = [prefix for prefix in self.ttls if path.startswith(prefix)]
+        return self.ttls[max(matches, key=len)] if matches else constants.DEFAULT_HTTP_CACHE_TTL
+
+    def _paths(self, url, api_key):
+        key = hashlib.sha256(f"{url}\0{api_key or ''}".encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, key)
+        return f"{base}.json", f"{base}.body"
+
+    @staticmethod
+    def _read_entry(meta_path, body_path):
+        if not os.path.exists(body_path):
+            return None
+        try:
+            with open(meta_path, 'r') as file:
+                return json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def get(self, url, api_key=None, headers=None, timeout=constants.FIO_TIMEOUT):
+        """
+        GET a URL through the cache. Bodies are streamed to disk, so large responses are never held in memory.
+        :param url: URL to fetch.
+        :param api_key: Optional API key, sent as the Authorization header and part of the cache key.
+        :param headers: Optional extra request headers.
+        :param timeout: Request timeout in seconds.
+        :return: CachedResponse.
+        """
+        meta_path, body_path = self._paths(url, api_key)
+        entry = self._read_entry(meta_path, body_path)
+        if entry and time.time() - entry["fetched_at"] < self.ttl_for(url):
+            metrics.inc("http_cache_total", outcome="hit")
+            return CachedResponse(url, body_path, entry["body_hash"])
+
+        request_headers = dict(headers or {})
+        if api_key:
+            request_headers["Authorization"] = api_key
+        if entry:
+            if entry.get("etag"):
+                request_headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                request_headers["If-Modified-Since"] = entry["last_modified"]
+
+        if self.rate_limiter:
+            self.rate_limiter.wait(api_key)
+        started = time.perf_counter()
+        response = self.session.get(url, headers=request_headers, timeout=timeout, stream=True)
+        try:
+            if response.status_code == 304 and entry:
+                metrics.observe("http_request_seconds", time.perf_counter() - started, service="fio")
+                metrics.inc("http_cache_total", outcome="not_modified")
+                entry["fetched_at"] = time.time()
+                write_atomic(meta_path, json.dumps(entry))
+                return CachedResponse(url, body_path, entry["body_hash"])
+
+            response.raise_for_status()
+            digest = hashlib.sha256()
+
+            def write_body(temp_path):
+                with open(temp_path, 'wb') as file:
+                    for chunk in response.iter_content(chunk_size=constants.HTTP_CHUNK_SIZE):
+                        digest.update(chunk)
+                        file.write(chunk)
+
+            write_atomic(body_path, write_body)
+        finally:
+            response.close()
+        metrics.observe("http_request_seconds", time.perf_counter() - started, service="fio")
+        metrics.inc("http_cache_total", outcome="fetched")
+
+        body_hash = digest.hexdigest()
+        write_atomic(meta_path, json.dumps({
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "body_hash": body_hash,
+            "fetched_at": time.time(),
+        }))
+        return CachedResponse(url, body_path, body_hash)
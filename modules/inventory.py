@@ -0,0 +1,79 @@
+import threading
+
+from modules.metrics import metrics
+
+# Storage containers: kind -> (container table, location column, material table, parent column)
+CONTAINERS = {
+    "planets": ("user_planets", "planet_natural_id", "storage_materials", "user_planet_id"),
+    "warehouses": ("user_warehouses", "location_natural_id", "warehouse_materials", "user_warehouse_id"),
+}
+
+
+class InventoryIndex:
+    """
+    Read-only in-memory index of every user's stock, by container kind, location and material ticker.
+    Each user's entry remembers the fio_storage:<user> fingerprint it was loaded under, so refresh() only
+    rereads the users whose storage sync actually changed something.
+    """
+
+    def __init__(self, db):
+        """
+        Load the inventory index.
+        :param db: Database instance to load from.
+        """
+        self.db = db
+        self.users = {}  # username -> {kind: {location: {ticker: amount}}}
+        self.fingerprints = {}  # username -> fio_storage:<user> content hash the entry was loaded under
+        self._lock = threading.Lock()
+
+        self.refresh()
+
+    def _load(self, usernames):
+        """Read the stock of a batch of users."""
+        user_placeholders = ", ".join(["%s"] * len(usernames))
+        users = {username: {kind: {} for kind in CONTAINERS} for username in usernames}
+        for kind, (table, location_column, material_table, parent_column) in CONTAINERS.items():
+            rows = self.db.fetch_rows(f"SELECT c.prun_username, c.{location_column}, m.material_ticker, "
+                                      f"m.material_amount FROM {material_table} m "
+                                      f"JOIN {table} c ON c.id = m.{parent_column} "
+                                      f"WHERE c.prun_username IN ({user_placeholders})", list(usernames))
+            for username, location, ticker, amount in rows:
+                materials = users[username][kind].setdefault(location, {})
+                materials[ticker] = materials.get(ticker, 0) + amount
+        return users
+
+    @metrics.timed_stage("inventory_index")
+    def refresh(self):
+        """
+        Reload the users whose storage fingerprint moved, and drop users no longer synced.
+        :return: Number of users reloaded, or None if reading failed.
+        """
+        state = self.db.get_sync_state()
+        fingerprints = {stage[len("fio_storage:"):]: entry["content_hash"] for stage, entry in state.items()
+                        if stage.startswith("fio_storage:")}
+        changed = self.db.changed_users(fingerprints, self.fingerprints)
+
+        loaded = {}
+        try:
+            for usernames in self.db.batches(changed):
+                loaded.update(self._load(usernames))
+        except Exception as e:
+            print(f"Error loading the inventory index: {e}")
+            return None
+
+        with self._lock:
+            users = {username: entry for username, entry in self.users.items() if username in fingerprints}
+            users.update(loaded)
+            self.users = users
+            self.fingerprints = fingerprints
+        if changed:
+            print(f"Inventory index reloaded {len(changed)} users.")
+        return len(changed)
+
+    def inventory(self, username):
+        """
+        Look up a user's stock.
+        :return: Dict mapping container kind to {location: {ticker: amount}}, or None if the user is unknown.
+        """
+        with self._lock:
+            return self.users.get(username)
@@ -0,0 +1,210 @@
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+import modules.constants as constants
+from modules.fileutil import write_atomic
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is +Inf
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    """Escape a Prometheus label value."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """
+    Thread-safe counters, gauges and latency histograms, exported as a Prometheus textfile or JSON.
+    Recording is a dictionary update under a lock, so it is cheap enough for per-statement use.
+    """
+
+    def __init__(self, prefix=constants.SCRIPT_NAME.lower()):
+        self.prefix = prefix
+        self.counters = defaultdict(float)  # (name, labels) -> value
+        self.gauges = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """Add to a counter."""
+        with self._lock:
+            self.counters[self._key(name, labels)] += value
+
+    def set(self, name, value, **labels):
+        """Set a gauge."""
+        with self._lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        """Record a latency in a histogram."""
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    histogram[index] += 1
+                    break
+            else:
+                histogram[len(LATENCY_BUCKETS)] += 1
+            histogram[-1] += seconds
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time a with block into a histogram, whether or not it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    @contextmanager
+    def stage(self, stage):
+        """Record the duration and outcome of one run of a pipeline stage."""
+        started = time.perf_counter()
+        outcome = "failed"
+        try:
+            yield
+            outcome = "succeeded"
+        finally:
+            self.set("stage_duration_seconds", time.perf_counter() - started, stage=stage)
+            self.set("stage_last_run_timestamp_seconds", time.time(), stage=stage)
+            self.inc("stage_runs_total", stage=stage, outcome=outcome)
+
+    def timed_stage(self, stage):
+        """Decorator recording every call of a function as a run of the given stage."""
+        def decorate(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def to_prometheus(self):
+        """Render every metric in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            histograms = {key: list(value) for key, value in self.histograms.items()}
+
+        lines = []
+        for kind, values in (("counter", counters), ("gauge", gauges)):
+            for name in sorted({name for name, _ in values}):
+                lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+                for (metric, labels), value in sorted(values.items()):
+                    if metric == name:
+                        lines.append(f"{self.prefix}_{name}{self._labels(labels)} {value}")
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# TYPE {self.prefix}_{name} histogram")
+            for (metric, labels), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram):
+                    cumulative += count
+                    lines.append(f"{self.prefix}_{name}_bucket{self._labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.prefix}_{name}_sum{self._labels(labels)} {histogram[-1]}")
+                lines.append(f"{self.prefix}_{name}_count{self._labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self):
+        """Return every metric as a JSON-serializable dict."""
+        def entries(values, render):
+            return [{"name": name, "labels": dict(labels), **render(value)}
+                    for (name, labels), value in sorted(values.items())]
+
+        with self._lock:
+            return {
+                "counters": entries(self.counters, lambda value: {"value": value}),
+                "gauges": entries(self.gauges, lambda value: {"value": value}),
+                "histograms": entries(self.histograms, lambda histogram: {
+                    "buckets": dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"], histogram[:-1])),
+                    "count": sum(histogram[:-1]),
+                    "sum": histogram[-1],
+                }),
+            }
+
+    def export(self, textfile=None, json_file=None):
+        """
+        Write the current metrics to a Prometheus textfile (for node_exporter's textfile collector) and/or a
+        JSON file. Files are replaced atomically, so a scraper never reads a partial file.
+        """
+        try:
+            if textfile:
+                write_atomic(textfile, self.to_prometheus())
+            if json_file:
+                write_atomic(json_file, json.dumps(self.to_dict(), indent=2))
+        except OSError as e:
+            print(f"Error exporting metrics: {e}")
+
+
+def _command(operation):
+    """Return the leading SQL keyword of a statement, used as its command label."""
+    words = operation.split(None, 1)
+    return words[0].upper() if words else ""
+
+
+class InstrumentedCursor:
+    """Cursor wrapper counting and timing every statement it executes."""
+
+    def __init__(self, cursor, registry):
+        self._cursor = cursor
+        self._registry = registry
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        command = _command(operation)
+        self._registry.inc("db_statements_total", command=command)
+        with self._registry.timer("db_statement_seconds", command=command):
+            return self._cursor.execute(operation, params, *args, **kwargs)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        command = _command(operation)
+        self._registry.inc("db_statements_total", command=command)
+        with self._registry.timer("db_statement_seconds", command=command):
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class InstrumentedConnection:
+    """Connection wrapper whose cursors are instrumented and whose commits are counted."""
+
+    def __init__(self, connection, registry):
+        self._connection = connection
+        self._registry = registry
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._connection.cursor(*args, **kwargs), self._registry)
+
+    def commit(self):
+        self._registry.inc("db_statements_total", command="COMMIT")
+        return self._connection.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+# Process-wide registry shared by every instrumented module
+metrics = Metrics()
@@ -0,0 +1,524 @@
+# Ordered schema migrations: (version, description, statements).
+# Append new steps to the end with the next version number; never edit a step that has shipped.
+# Every step needs a counterpart with the same version in SQLITE_MIGRATIONS.
+
+# MySQL errors meaning a DDL statement's change already exists: table exists, duplicate column, duplicate key name
+ALREADY_APPLIED_ERRORS = {1050, 1060, 1061}
+
+SCHEMA_VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INT PRIMARY KEY,
+        description VARCHAR(255) NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+MIGRATIONS = [
+    (1, "Initial schema", [
+        """
+        CREATE TABLE IF NOT EXISTS materials (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            ticker VARCHAR(50) UNIQUE NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            weight FLOAT NOT NULL,
+            volume FLOAT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS planets (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            natural_id VARCHAR(255) UNIQUE NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            description TEXT,
+            resource_richness JSON,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_data (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            prun_username VARCHAR(255) NOT NULL,
+            fio_api_key TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_planets (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            prun_username VARCHAR(255) NOT NULL,
+            planet_id VARCHAR(255) NOT NULL,
+            planet_natural_id VARCHAR(255) NOT NULL,
+            planet_name VARCHAR(255) NOT NULL,
+            weight_capacity FLOAT NOT NULL DEFAULT 0,
+            volume_capacity FLOAT NOT NULL DEFAULT 0,
+            weight_load FLOAT NOT NULL DEFAULT 0,
+            volume_load FLOAT NOT NULL DEFAULT 0,
+            UNIQUE KEY (prun_username, planet_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS storage_materials (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user_planet_id INT NOT NULL,
+            material_ticker VARCHAR(255) NOT NULL,
+            material_amount FLOAT NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_planet_id) REFERENCES user_planets(id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_warehouses (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            prun_username VARCHAR(255) NOT NULL,
+            store_id VARCHAR(255) NOT NULL,
+            location_name VARCHAR(255) NOT NULL,
+            location_natural_id VARCHAR(255) NOT NULL,
+            weight_load FLOAT NOT NULL DEFAULT 0,
+            weight_capacity FLOAT NOT NULL DEFAULT 0,
+            volume_load FLOAT NOT NULL DEFAULT 0,
+            volume_capacity FLOAT NOT NULL DEFAULT 0,
+            UNIQUE KEY (prun_username, store_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS warehouse_materials (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user_warehouse_id INT NOT NULL,
+            material_ticker VARCHAR(255) NOT NULL,
+            material_amount FLOAT NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_warehouse_id) REFERENCES user_warehouses(id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS pricing (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            mat VARCHAR(50) NOT NULL,
+            location VARCHAR(255) NOT NULL,
+            price FLOAT NOT NULL,
+            UNIQUE KEY (mat, location)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS shipping (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            from_location VARCHAR(255) NOT NULL,
+            to_location VARCHAR(255) NOT NULL,
+            price FLOAT NOT NULL,
+            UNIQUE KEY (from_location, to_location)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS production_lines (
+            production_line_id VARCHAR(255) PRIMARY KEY,
+            prun_username VARCHAR(255) NOT NULL,
+            planet_name VARCHAR(255) NOT NULL,
+            type VARCHAR(255) NOT NULL,
+            capacity FLOAT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS production_orders (
+            order_id VARCHAR(255) PRIMARY KEY,
+            production_line_id VARCHAR(255) NOT NULL,
+            duration_ms BIGINT NOT NULL,
+            recurring BOOLEAN NOT NULL DEFAULT FALSE,
+            recipe_name VARCHAR(255) NOT NULL,
+            FOREIGN KEY (production_line_id) REFERENCES production_lines(production_line_id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS order_inputs (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            production_order_id VARCHAR(255) NOT NULL,
+            material_name VARCHAR(255) NOT NULL,
+            material_ticker VARCHAR(255) NOT NULL,
+            material_amount FLOAT NOT NULL DEFAULT 0,
+            FOREIGN KEY (production_order_id) REFERENCES production_orders(order_id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS order_outputs (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            production_order_id VARCHAR(255) NOT NULL,
+            material_name VARCHAR(255) NOT NULL,
+            material_ticker VARCHAR(255) NOT NULL,
+            material_amount FLOAT NOT NULL DEFAULT 0,
+            FOREIGN KEY (production_order_id) REFERENCES production_orders(order_id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS burn_rate (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            prun_username VARCHAR(255) NOT NULL,
+            planet_natural_id VARCHAR(255) NOT NULL,
+            planet_name VARCHAR(255) NOT NULL,
+            material_ticker VARCHAR(255) NOT NULL,
+            daily_consumption FLOAT NOT NULL,
+            essential BOOLEAN NOT NULL DEFAULT FALSE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sync_state (
+            stage VARCHAR(255) PRIMARY KEY,
+            content_hash CHAR(64) NOT NULL,
+            modified_time VARCHAR(64),
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """
+    ]),
+    (2, "Secondary indexes for inventory, burn rate and production lookups", [
+        "ALTER TABLE storage_materials "
+        "ADD INDEX idx_storage_materials_planet_ticker (user_planet_id, material_ticker)",
+        "ALTER TABLE warehouse_materials "
+        "ADD INDEX idx_warehouse_materials_warehouse_ticker (user_warehouse_id, material_ticker)",
+        "ALTER TABLE burn_rate "
+        "ADD INDEX idx_burn_rate_user_planet_ticker (prun_username, planet_natural_id, material_ticker)",
+        "ALTER TABLE production_lines ADD INDEX idx_production_lines_user (prun_username)",
+    ]),
+    (3, "Materialized days-of-supply and restock projection", [
+        """
+        CREATE TABLE IF NOT EXISTS supply_projection (
+            prun_username VARCHAR(255) NOT NULL,
+            planet_natural_id VARCHAR(255) NOT NULL,
+            planet_name VARCHAR(255) NOT NULL,
+            material_ticker VARCHAR(255) NOT NULL,
+            material_amount FLOAT NOT NULL DEFAULT 0,
+            daily_consumption FLOAT NOT NULL,
+            days_of_supply FLOAT NOT NULL,
+            restock_amount FLOAT NOT NULL DEFAULT 0,
+            essential BOOLEAN NOT NULL DEFAULT FALSE,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (prun_username, planet_natural_id, material_ticker),
+            INDEX idx_supply_projection_days (days_of_supply)
+        )
+        """,
+    ]),
+    (4, "Arbitrage opportunities", [
+        """
+        CREATE TABLE IF NOT EXISTS arbitrage_opportunities (
+            mat VARCHAR(50) NOT NULL,
+            position INT NOT NULL,
+            buy_location VARCHAR(255) NOT NULL,
+            sell_location VARCHAR(255) NOT NULL,
+            buy_price FLOAT NOT NULL,
+            sell_price FLOAT NOT NULL,
+            shipping_cost FLOAT NOT NULL,
+            profit FLOAT NOT NULL,
+            PRIMARY KEY (mat, position),
+            INDEX idx_arbitrage_profit (profit)
+        )
+        """,
+    ]),
+    (5, "Monthly partitioned price history with daily OHLC rollups", [
+        """
+        CREATE TABLE IF NOT EXISTS pricing_history (
+            mat VARCHAR(50) NOT NULL,
+            location VARCHAR(255) NOT NULL,
+            price FLOAT NOT NULL,
+            recorded_at DATETIME NOT NULL,
+            KEY idx_pricing_history_key (mat, location, recorded_at)
+        )
+        PARTITION BY RANGE (TO_DAYS(recorded_at)) (
+            PARTITION p_future VALUES LESS THAN MAXVALUE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS shipping_history (
+            from_location VARCHAR(255) NOT NULL,
+            to_location VARCHAR(255) NOT NULL,
+            price FLOAT NOT NULL,
+            recorded_at DATETIME NOT NULL,
+            KEY idx_shipping_history_key (from_location, to_location, recorded_at)
+        )
+        PARTITION BY RANGE (TO_DAYS(recorded_at)) (
+            PARTITION p_future VALUES LESS THAN MAXVALUE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS pricing_daily (
+            mat VARCHAR(50) NOT NULL,
+            location VARCHAR(255) NOT NULL,
+            day DATE NOT NULL,
+            open FLOAT NOT NULL,
+            high FLOAT NOT NULL,
+            low FLOAT NOT NULL,
+            close FLOAT NOT NULL,
+            samples INT NOT NULL,
+            PRIMARY KEY (mat, location, day)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS shipping_daily (
+            from_location VARCHAR(255) NOT NULL,
+            to_location VARCHAR(255) NOT NULL,
+            day DATE NOT NULL,
+            open FLOAT NOT NULL,
+            high FLOAT NOT NULL,
+            low FLOAT NOT NULL,
+            close FLOAT NOT NULL,
+            samples INT NOT NULL,
+            PRIMARY KEY (from_location, to_location, day)
+        )
+        """,
+    ]),
+]
+
+# The same steps for the embedded SQLite backend. SQLite has no AUTO_INCREMENT (an INTEGER PRIMARY KEY is the
+# rowid), no inline secondary indexes, no ON UPDATE CURRENT_TIMESTAMP (triggers stand in for it) and no
+# partitioning, so history is expired with range deletes on recorded_at instead.
+SQLITE_MIGRATIONS = [
+    (1, "Initial schema", [
+        """
+        CREATE TABLE IF NOT EXISTS materials (
+            id INTEGER PRIMARY KEY,
+            ticker VARCHAR(50) UNIQUE NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            weight FLOAT NOT NULL,
+            volume FLOAT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS materials_updated_at AFTER UPDATE ON materials FOR EACH ROW
+        BEGIN
+            UPDATE materials SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+        END
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS planets (
+            id INTEGER PRIMARY KEY,
+            natural_id VARCHAR(255) UNIQUE NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            description TEXT,
+            resource_richness TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_data (
+            id INTEGER PRIMARY KEY,
+            prun_username VARCHAR(255) NOT NULL,
+            fio_api_key TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_planets (
+            id INTEGER PRIMARY KEY,
+            prun_username VARCHAR(255) NOT NULL,
+            planet_id VARCHAR(255) NOT NULL,
+            planet_natural_id VARCHAR(255) NOT NULL,
+            planet_name VARCHAR(255) NOT NULL,
+            weight_capacity FLOAT NOT NULL DEFAULT 0,
+            volume_capacity FLOAT NOT NULL DEFAULT 0,
+            weight_load FLOAT NOT NULL DEFAULT 0,
+            volume_load FLOAT NOT NULL DEFAULT 0,
+            UNIQUE (prun_username, planet_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS storage_materials (
+            id INTEGER PRIMARY KEY,
+            user_planet_id INTEGER NOT NULL,
+            material_ticker VARCHAR(255) NOT NULL,
+            material_amount FLOAT NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_planet_id) REFERENCES user_planets(id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_warehouses (
+            id INTEGER PRIMARY KEY,
+            prun_username VARCHAR(255) NOT NULL,
+            store_id VARCHAR(255) NOT NULL,
+            location_name VARCHAR(255) NOT NULL,
+            location_natural_id VARCHAR(255) NOT NULL,
+            weight_load FLOAT NOT NULL DEFAULT 0,
+            weight_capacity FLOAT NOT NULL DEFAULT 0,
+            volume_load FLOAT NOT NULL DEFAULT 0,
+            volume_capacity FLOAT NOT NULL DEFAULT 0,
+            UNIQUE (prun_username, store_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS warehouse_materials (
+            id INTEGER PRIMARY KEY,
+            user_warehouse_id INTEGER NOT NULL,
+            material_ticker VARCHAR(255) NOT NULL,
+            material_amount FLOAT NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_warehouse_id) REFERENCES user_warehouses(id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS pricing (
+            id INTEGER PRIMARY KEY,
+            mat VARCHAR(50) NOT NULL,
+            location VARCHAR(255) NOT NULL,
+            price FLOAT NOT NULL,
+            UNIQUE (mat, location)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS shipping (
+            id INTEGER PRIMARY KEY,
+            from_location VARCHAR(255) NOT NULL,
+            to_location VARCHAR(255) NOT NULL,
+            price FLOAT NOT NULL,
+            UNIQUE (from_location, to_location)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS production_lines (
+            production_line_id VARCHAR(255) PRIMARY KEY,
+            prun_username VARCHAR(255) NOT NULL,
+            planet_name VARCHAR(255) NOT NULL,
+            type VARCHAR(255) NOT NULL,
+            capacity FLOAT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS production_orders (
+            order_id VARCHAR(255) PRIMARY KEY,
+            production_line_id VARCHAR(255) NOT NULL,
+            duration_ms BIGINT NOT NULL,
+            recurring BOOLEAN NOT NULL DEFAULT FALSE,
+            recipe_name VARCHAR(255) NOT NULL,
+            FOREIGN KEY (production_line_id) REFERENCES production_lines(production_line_id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS order_inputs (
+            id INTEGER PRIMARY KEY,
+            production_order_id VARCHAR(255) NOT NULL,
+            material_name VARCHAR(255) NOT NULL,
+            material_ticker VARCHAR(255) NOT NULL,
+            material_amount FLOAT NOT NULL DEFAULT 0,
+            FOREIGN KEY (production_order_id) REFERENCES production_orders(order_id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS order_outputs (
+            id INTEGER PRIMARY KEY,
+            production_order_id VARCHAR(255) NOT NULL,
+            material_name VARCHAR(255) NOT NULL,
+            material_ticker VARCHAR(255) NOT NULL,
+            material_amount FLOAT NOT NULL DEFAULT 0,
+            FOREIGN KEY (production_order_id) REFERENCES production_orders(order_id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS burn_rate (
+            id INTEGER PRIMARY KEY,
+            prun_username VARCHAR(255) NOT NULL,
+            planet_natural_id VARCHAR(255) NOT NULL,
+            planet_name VARCHAR(255) NOT NULL,
+            material_ticker VARCHAR(255) NOT NULL,
+            daily_consumption FLOAT NOT NULL,
+            essential BOOLEAN NOT NULL DEFAULT FALSE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sync_state (
+            stage VARCHAR(255) PRIMARY KEY,
+            content_hash CHAR(64) NOT NULL,
+            modified_time VARCHAR(64),
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS sync_state_updated_at AFTER UPDATE ON sync_state FOR EACH ROW
+        BEGIN
+            UPDATE sync_state SET updated_at = CURRENT_TIMESTAMP WHERE stage = NEW.stage;
+        END
+        """,
+    ]),
+    (2, "Secondary indexes for inventory, burn rate and production lookups", [
+        "CREATE INDEX IF NOT EXISTS idx_storage_materials_planet_ticker "
+        "ON storage_materials (user_planet_id, material_ticker)",
+        "CREATE INDEX IF NOT EXISTS idx_warehouse_materials_warehouse_ticker "
+        "ON warehouse_materials (user_warehouse_id, material_ticker)",
+        "CREATE INDEX IF NOT EXISTS idx_burn_rate_user_planet_ticker "
+        "ON burn_rate (prun_username, planet_natural_id, material_ticker)",
+        "CREATE INDEX IF NOT EXISTS idx_production_lines_user ON production_lines (prun_username)",
+    ]),
+    (3, "Materialized days-of-supply and restock projection", [
+        """
+        CREATE TABLE IF NOT EXISTS supply_projection (
+            prun_username VARCHAR(255) NOT NULL,
+            planet_natural_id VARCHAR(255) NOT NULL,
+            planet_name VARCHAR(255) NOT NULL,
+            material_ticker VARCHAR(255) NOT NULL,
+            material_amount FLOAT NOT NULL DEFAULT 0,
+            daily_consumption FLOAT NOT NULL,
+            days_of_supply FLOAT NOT NULL,
+            restock_amount FLOAT NOT NULL DEFAULT 0,
+            essential BOOLEAN NOT NULL DEFAULT FALSE,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (prun_username, planet_natural_id, material_ticker)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_supply_projection_days ON supply_projection (days_of_supply)",
+    ]),
+    (4, "Arbitrage opportunities", [
+        """
+        CREATE TABLE IF NOT EXISTS arbitrage_opportunities (
+            mat VARCHAR(50) NOT NULL,
+            position INT NOT NULL,
+            buy_location VARCHAR(255) NOT NULL,
+            sell_location VARCHAR(255) NOT NULL,
+            buy_price FLOAT NOT NULL,
+            sell_price FLOAT NOT NULL,
+            shipping_cost FLOAT NOT NULL,
+            profit FLOAT NOT NULL,
+            PRIMARY KEY (mat, position)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_arbitrage_profit ON arbitrage_opportunities (profit)",
+    ]),
+    (5, "Monthly partitioned price history with daily OHLC rollups", [
+        """
+        CREATE TABLE IF NOT EXISTS pricing_history (
+            mat VARCHAR(50) NOT NULL,
+            location VARCHAR(255) NOT NULL,
+            price FLOAT NOT NULL,
+            recorded_at DATETIME NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_pricing_history_key ON pricing_history (mat, location, recorded_at)",
+        "CREATE INDEX IF NOT EXISTS idx_pricing_history_recorded ON pricing_history (recorded_at)",
+        """
+        CREATE TABLE IF NOT EXISTS shipping_history (
+            from_location VARCHAR(255) NOT NULL,
+            to_location VARCHAR(255) NOT NULL,
+            price FLOAT NOT NULL,
+            recorded_at DATETIME NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_shipping_history_key "
+        "ON shipping_history (from_location, to_location, recorded_at)",
+        "CREATE INDEX IF NOT EXISTS idx_shipping_history_recorded ON shipping_history (recorded_at)",
+        """
+        CREATE TABLE IF NOT EXISTS pricing_daily (
+            mat VARCHAR(50) NOT NULL,
+            location VARCHAR(255) NOT NULL,
+            day DATE NOT NULL,
+            open FLOAT NOT NULL,
+            high FLOAT NOT NULL,
+            low FLOAT NOT NULL,
+            close FLOAT NOT NULL,
+            samples INT NOT NULL,
+            PRIMARY KEY (mat, location, day)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS shipping_daily (
+            from_location VARCHAR(255) NOT NULL,
+            to_location VARCHAR(255) NOT NULL,
+            day DATE NOT NULL,
+            open FLOAT NOT NULL,
+            high FLOAT NOT NULL,
+            low FLOAT NOT NULL,
+            close FLOAT NOT NULL,
+            samples INT NOT NULL,
+            PRIMARY KEY (from_location, to_location, day)
+        )
+        """,
+    ]),
+]
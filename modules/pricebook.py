@@ -0,0 +1,166 @@
+import threading
+from collections import OrderedDict
+import modules.constants as constants
+
+# Indexed tables: table -> (group column, member column, value column)
+INDEXES = {
+    "pricing": ("mat", "location", "price"),
+    "shipping": ("from_location", "to_location", "price"),
+}
+
+
+class PriceBook:
+    """
+    Read-only in-memory index over the pricing and shipping tables.
+    Prices are grouped by material and shipping quotes by origin, so point lookups, per-material location
+    scans and per-origin route scans are plain dictionary lookups. Once more than max_entries values are
+    cached, the least recently used groups are evicted and reloaded from the database on their next lookup.
+    The cap counts cached values, not bytes, and whole groups are kept or evicted: the most recently used
+    group always stays cached, so a single group larger than max_entries can exceed the cap on its own.
+    """
+
+    def __init__(self, db, max_entries=constants.DEFAULT_PRICEBOOK_MAX_ENTRIES):
+        """
+        Load the price book and subscribe it to sync updates.
+        :param db: Database instance to load from.
+        :param max_entries: Maximum number of cached prices and shipping quotes (an entry count, not a size in
+            bytes); exceeded only by a single group larger than it.
+        """
+        self.db = db
+        self.max_entries = int(max_entries)
+        self.groups = OrderedDict()  # (table, group key) -> {member: value}, least recently used first
+        self.entries = 0
+        self.complete = {table: False for table in INDEXES}  # Whether every group of a table is cached
+        self.generation = 0  # Bumped whenever cached contents change, to detect misses racing a sync
+        self._lock = threading.RLock()
+
+        self.load()
+        db.add_listener(self.apply_changes)
+
+    def load(self):
+        """
+        Reload both tables, stopping at a group boundary once the entry cap is reached. The last group read is
+        loaded whole, so it may take the count over the cap until eviction trims older groups.
+        """
+        groups = OrderedDict()
+        entries = 0
+        complete = {}
+        for table, (group_column, member_column, value_column) in INDEXES.items():
+            rows = self.db.fetch_rows(f"SELECT {group_column}, {member_column}, {value_column} FROM {table} "
+                                      f"ORDER BY {group_column}")
+            complete[table] = True
+            for group, member, value in rows:
+                if (table, group) not in groups:
+                    if entries >= self.max_entries:
+                        complete[table] = False
+                        break
+                    groups[(table, group)] = {}
+                groups[(table, group)][member] = value
+                entries += 1
+
+        with self._lock:
+            self.groups = groups
+            self.entries = entries
+            self.complete = complete
+            self.generation += 1
+            # The last group read may have pushed the total over the cap
+            self._evict()
+            entries = self.entries
+        print(f"Price book loaded with {entries} entries.")
+
+    def _evict(self):
+        """Drop least recently used groups until the cache fits under the entry cap, keeping at least one group."""
+        while self.entries > self.max_entries and len(self.groups) > 1:
+            (table, _), members = self.groups.popitem(last=False)
+            self.entries -= len(members)
+            self.complete[table] = False
+
+    def _group(self, table, key):
+        """
+        Return the cached members of a group, loading it from the database on a miss if needed.
+        The database is read outside the lock, so a miss never stalls lookups of cached groups. Groups that turn
+        out empty are not cached, so lookups of arbitrary unknown keys cannot grow the cache.
+        """
+        with self._lock:
+            members = self.groups.get((table, key))
+            if members is not None:
+                self.groups.move_to_end((table, key))
+                return members
+            if self.complete[table]:
+                return None
+            generation = self.generation
+
+        group_column, member_column, value_column = INDEXES[table]
+        rows = self.db.fetch_rows(f"SELECT {member_column}, {value_column} FROM {table} WHERE {group_column} = %s",
+                                  (key,))
+        members = dict(rows)
+        if not members:
+            return None
+
+        with self._lock:
+            cached = self.groups.get((table, key))
+            if cached is not None:  # Another thread loaded it meanwhile
+                return cached
+            # A sync committed since the read may have changed this group, so only cache a read nothing raced
+            if generation == self.generation:
+                self.groups[(table, key)] = members
+                self.entries += len(members)
+                self._evict()
+            return members
+
+    def price(self, mat, location):
+        """
+        Look up the price of a material at a location.
+        :return: Price, or None if unknown.
+        """
+        members = self._group("pricing", mat)
+        return members.get(location) if members else None
+
+    def prices_for(self, mat):
+        """
+        Look up every location price of a material.
+        :return: Dict mapping location to price.
+        """
+        return dict(self._group("pricing", mat) or {})
+
+    def shipping_price(self, from_location, to_location):
+        """
+        Look up the shipping price between two locations.
+        :return: Price, or None if unknown.
+        """
+        members = self._group("shipping", from_location)
+        return members.get(to_location) if members else None
+
+    def routes_from(self, from_location):
+        """
+        Look up every shipping price from a location.
+        :return: Dict mapping destination to price.
+        """
+        return dict(self._group("shipping", from_location) or {})
+
+    def apply_changes(self, table, changes, deletes):
+        """
+        Apply committed sync changes to the cached groups. Registered as a Database listener.
+        Changes to groups that are not cached are skipped; those groups are read fresh on their next lookup.
+        :param table: Name of the synced table.
+        :param changes: Dict mapping (group, member) keys to new values.
+        :param deletes: List of removed (group, member) keys.
+        """
+        if table not in INDEXES:
+            return
+        with self._lock:
+            self.generation += 1
+            for (group, member), value in changes.items():
+                members = self.groups.get((table, group))
+                if members is None:
+                    if not self.complete[table]:
+                        continue
+                    members = self.groups[(table, group)] = {}
+                if member not in members:
+                    self.entries += 1
+                members[member] = value
+            for group, member in deletes:
+                members = self.groups.get((table, group))
+                if members is not None and members.pop(member, None) is not None:
+                    self.entries -= 1
+            self._evict()
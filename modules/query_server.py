@@ -0,0 +1,181 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import modules.constants as constants
+from modules.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QueryError(Exception):
+    """A request the service cannot answer, carrying the HTTP status to reply with."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _keys(query, name, required=False):
+    """Return the values of a repeatable query parameter, also accepting comma-separated lists."""
+    values = [value for raw in query.get(name, []) for value in raw.split(",") if value]
+    if required and not values:
+        raise QueryError(400, f"Missing query parameter '{name}'.")
+    if len(values) > constants.MAX_QUERY_KEYS:
+        raise QueryError(400, f"At most {constants.MAX_QUERY_KEYS} '{name}' values are allowed per request.")
+    return values
+
+
+def _etag_matches(header, etag):
+    """Check an If-None-Match header against an ETag, using the weak comparison HTTP prescribes for GET."""
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+class QueryServer:
+    """
+    Read-only HTTP/JSON service answering prices, shipping quotes and inventory from in-memory indexes, so
+    bots reading what the sync wrote never reach the database. Runs on daemon threads next to the scheduler.
+
+    Endpoints (GET); every multi-key parameter can be repeated or given as a comma-separated list:
+        /prices?mat=RAT,DW[&location=...]       Prices of each material, optionally at the given locations only
+        /shipping?from=ANT,BEN                  Direct shipping prices from each origin
+        /routes?pair=ANT:BEN&pair=BEN:MOR       Cheapest (possibly multi-hop) route and cost of each pair
+        /inventory?user=alice[&ticker=...]      Stock of each user by container kind, location and ticker
+        /health                                 Liveness check
+
+    Responses carry an ETag of their body; a request whose If-None-Match matches gets 304 Not Modified.
+    """
+
+    def __init__(self, pricebook, routes, inventory, host=constants.DEFAULT_SERVER_HOST,
+                 port=constants.DEFAULT_SERVER_PORT):
+        """
+        :param pricebook: PriceBook answering prices and direct shipping prices.
+        :param routes: RouteTable answering cheapest multi-hop routes.
+        :param inventory: InventoryIndex answering per-user stock.
+        :param host: Address to listen on.
+        :param port: Port to listen on.
+        """
+        self.pricebook = pricebook
+        self.routes = routes
+        self.inventory = inventory
+        self.host = host
+        self.port = int(port)
+        self.httpd = None
+        self.endpoints = {
+            "/prices": self.prices,
+            "/shipping": self.shipping,
+            "/routes": self.route_quotes,
+            "/inventory": self.user_inventory,
+            "/health": lambda query: {"status": "ok"},
+        }
+
+    def prices(self, query):
+        locations = _keys(query, "location")
+        result = {}
+        for mat in _keys(query, "mat", required=True):
+            prices = self.pricebook.prices_for(mat)
+            if locations:
+                prices = {location: prices[location] for location in locations if location in prices}
+            result[mat] = prices
+        return {"prices": result}
+
+    def shipping(self, query):
+        return {"shipping": {origin: self.pricebook.routes_from(origin)
+                             for origin in _keys(query, "from", required=True)}}
+
+    def route_quotes(self, query):
+        quotes = []
+        for pair in _keys(query, "pair", required=True):
+            origin, separator, destination = pair.partition(":")
+            if not separator:
+                raise QueryError(400, f"Expected 'pair' values as FROM:TO, got '{pair}'.")
+            route = self.routes.route(origin, destination)
+            quotes.append({"from": origin, "to": destination,
+                           "direct": self.pricebook.shipping_price(origin, destination),
+                           "cost": route[0] if route else None, "path": route[1] if route else None})
+        return {"routes": quotes}
+
+    def user_inventory(self, query):
+        tickers = set(_keys(query, "ticker"))
+        result = {}
+        for username in _keys(query, "user", required=True):
+            stock = self.inventory.inventory(username)
+            if stock is not None and tickers:
+                stock = {kind: {location: {ticker: amount for ticker, amount in materials.items() if ticker in tickers}
+                                for location, materials in locations.items()}
+                         for kind, locations in stock.items()}
+            result[username] = stock
+        return {"inventory": result}
+
+    def handle(self, path, headers):
+        """
+        Answer one GET request.
+        :param path: Request path including the query string.
+        :param headers: Request headers.
+        :return: Tuple of (status, response headers, body bytes).
+        """
+        url = urlsplit(path)
+        endpoint = self.endpoints.get(url.path)
+        try:
+            if endpoint is None:
+                raise QueryError(404, f"Unknown endpoint '{url.path}'.")
+            body = endpoint(parse_qs(url.query))
+            status = 200
+        except QueryError as e:
+            status, body = e.status, {"error": str(e)}
+        except Exception:
+            # The details are logged, not returned, so clients never see internal state
+            logger.exception("Error answering %s", path)
+            status, body = 500, {"error": "Internal error"}
+
+        payload = json.dumps(body, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        etag = f'"{hashlib.sha256(payload).hexdigest()[:32]}"'
+        response_headers = {"Content-Type": "application/json", "ETag": etag, "Cache-Control": "no-cache"}
+        if status == 200 and _etag_matches(headers.get("If-None-Match"), etag):
+            return 304, response_headers, b""
+        return status, response_headers, payload
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, so clients polling in a loop reuse their connection
+
+            def do_GET(self):
+                started = time.perf_counter()
+                status, headers, payload = server.handle(self.path, self.headers)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                endpoint = urlsplit(self.path).path if status != 404 else "unknown"
+                metrics.inc("api_requests_total", endpoint=endpoint, status=status)
+                metrics.observe("api_request_seconds", time.perf_counter() - started, endpoint=endpoint)
+
+            def log_message(self, format, *args):
+                logger.debug("%s - %s", self.address_string(), format % args)
+
+        return Handler
+
+    def start(self):
+        """Start serving on a background thread."""
+        self.httpd = ThreadingHTTPServer((self.host, self.port), self._handler_class())
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, name="query-server", daemon=True).start()
+        print(f"Query service listening on http://{self.host}:{self.httpd.server_address[1]}")
+
+    def stop(self):
+        """Stop serving and close the listening socket."""
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
@@ -0,0 +1,155 @@
+import contextlib
+import os
+import threading
+
+import numpy as np
+
+import modules.constants as constants
+from modules.fileutil import write_atomic
+
+# Next-hop value for pairs with no route
+NO_ROUTE = -1
+
+
+def floyd_warshall(cost):
+    """
+    Compute all-pairs cheapest paths over a dense cost matrix.
+    Each of the n relaxation steps is a single broadcast over the whole matrix, so the work is O(n^3)
+    arithmetic but only O(n) Python iterations.
+    :param cost: Square matrix of direct costs, with np.inf where there is no direct edge.
+    :return: Tuple of (distances, next_hops); next_hops[i, j] is the first stop after i on the cheapest path
+        to j, or NO_ROUTE.
+    """
+    n = len(cost)
+    distances = np.array(cost, dtype=np.float64)
+    np.fill_diagonal(distances, 0.0)
+    next_hops = np.where(np.isfinite(distances), np.arange(n), NO_ROUTE)
+    for k in range(n):
+        via = distances[:, k:k + 1] + distances[k:k + 1, :]
+        better = via < distances
+        distances = np.where(better, via, distances)
+        next_hops = np.where(better, next_hops[:, k:k + 1], next_hops)
+    return distances, next_hops
+
+
+class RouteTable:
+    """
+    Cheapest shipping routes between every pair of locations, including routes through intermediate stations.
+    The all-pairs solution is cached on disk under the shipping table's sync fingerprint, so it is only
+    recomputed after the shipping sheet actually changed.
+    """
+
+    def __init__(self, db, cache_dir=constants.ROUTE_CACHE_DIR, refresh=True):
+        """
+        Load the route table.
+        :param db: Database instance to read shipping from.
+        :param cache_dir: Directory holding cached solutions.
+        :param refresh: Load the table now; when False it stays empty until the first refresh().
+        """
+        self.db = db
+        self.cache_dir = cache_dir
+        self.fingerprint = None
+        self.locations = []
+        self.index = {}
+        self.distances = np.zeros((0, 0))
+        self.next_hops = np.zeros((0, 0), dtype=np.int64)
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+        if refresh:
+            self.refresh()
+
+    def _cache_path(self, fingerprint):
+        return os.path.join(self.cache_dir, f"{fingerprint}.npz")
+
+    def _compute(self):
+        """Read the shipping table and solve all-pairs cheapest paths."""
+        rows = self.db.fetch_rows("SELECT from_location, to_location, price FROM shipping")
+        locations = sorted({location for from_location, to_location, _ in rows
+                            for location in (from_location, to_location)})
+        index = {location: position for position, location in enumerate(locations)}
+        cost = np.full((len(locations), len(locations)), np.inf)
+        for from_location, to_location, price in rows:
+            cost[index[from_location], index[to_location]] = price
+        return (locations,) + floyd_warshall(cost)
+
+    def refresh(self):
+        """
+        Make the table match the current shipping fingerprint, loading a cached solution when one exists.
+        :return: True if the table changed.
+        """
+        # Serializes refreshes, so concurrent callers neither both recompute nor race on the cache files
+        with self._refresh_lock:
+            fingerprint = self.db.get_sync_state().get("shipping", {}).get("content_hash")
+            if fingerprint is not None and fingerprint == self.fingerprint:
+                return False
+
+            path = self._cache_path(fingerprint) if fingerprint else None
+            if path and os.path.exists(path):
+                with np.load(path) as cached:
+                    locations = cached["locations"].tolist()
+                    distances, next_hops = cached["distances"], cached["next_hops"]
+            else:
+                locations, distances, next_hops = self._compute()
+                if path:
+                    def save(temp_path):
+                        # np.savez appends .npz to a path without it, so it is given an open file instead
+                        with open(temp_path, 'wb') as file:
+                            np.savez(file, locations=np.array(locations, dtype=str), distances=distances,
+                                     next_hops=next_hops)
+
+                    write_atomic(path, save)
+                    # Solutions for older fingerprints are never read again
+                    for name in os.listdir(self.cache_dir):
+                        if name.endswith(".npz") and name != os.path.basename(path):
+                            with contextlib.suppress(FileNotFoundError):
+                                os.remove(os.path.join(self.cache_dir, name))
+
+            with self._lock:
+                self.fingerprint = fingerprint
+                self.locations = locations
+                self.index = {location: position for position, location in enumerate(locations)}
+                self.distances = distances
+                self.next_hops = next_hops
+            print(f"Route table ready for {len(locations)} locations.")
+            return True
+
+    def cost_matrix(self, locations):
+        """
+        Build the cheapest-cost matrix between the given locations.
+        :param locations: List of location names; names unknown to the route table are unreachable.
+        :return: Square array where [i, j] is the cheapest cost from locations[i] to locations[j], or np.inf.
+        """
+        with self._lock:
+            positions = np.array([self.index.get(location, NO_ROUTE) for location in locations], dtype=np.int64)
+            known = positions != NO_ROUTE
+            costs = np.full((len(locations), len(locations)), np.inf)
+            costs[np.ix_(known, known)] = self.distances[np.ix_(positions[known], positions[known])]
+        np.fill_diagonal(costs, 0.0)
+        return costs
+
+    def cost(self, from_location, to_location):
+        """
+        Look up the cheapest shipping cost between two locations.
+        :return: Cost, or None if there is no route.
+        """
+        with self._lock:
+            start, end = self.index.get(from_location), self.index.get(to_location)
+            if start is None or end is None or not np.isfinite(self.distances[start, end]):
+                return None
+            return float(self.distances[start, end])
+
+    def route(self, from_location, to_location):
+        """
+        Reconstruct the cheapest route between two locations by following the next-hop table.
+        :return: Tuple of (cost, list of locations from origin to destination), or None if there is no route.
+        """
+        with self._lock:
+            start, end = self.index.get(from_location), self.index.get(to_location)
+            if start is None or end is None or self.next_hops[start, end] == NO_ROUTE:
+                return None
+            path = [start]
+            while path[-1] != end:
+                path.append(int(self.next_hops[path[-1], end]))
+            return float(self.distances[start, end]), [self.locations[position] for position in path]
@@ -0,0 +1,92 @@
+import random
+import signal
+import threading
+import time
+
+
+class Job:
+    """A named callable run repeatedly by the Scheduler."""
+
+    def __init__(self, name, interval, func, jitter=0.0):
+        """
+        Initialize the job.
+        :param name: Name used in log messages.
+        :param interval: Seconds between the start of consecutive runs.
+        :param func: Callable taking no arguments.
+        :param jitter: Maximum number of seconds randomly added to or removed from each wait.
+        """
+        self.name = name
+        self.interval = float(interval)
+        self.func = func
+        self.jitter = float(jitter)
+
+
+class Scheduler:
+    """Runs each job on its own interval in its own thread, so a slow job never delays the others."""
+
+    def __init__(self, after_run=None):
+        """
+        Initialize the scheduler.
+        :param after_run: Optional callable run after every job run, e.g. to export metrics.
+        """
+        self.after_run = after_run
+        self.jobs = []
+        self.threads = []
+        self.stop_event = threading.Event()
+
+    def add_job(self, name, interval, func, jitter=0.0):
+        """
+        Register a job. Jobs added after start() are not run.
+        :param name: Name used in log messages.
+        :param interval: Seconds between the start of consecutive runs.
+        :param func: Callable taking no arguments.
+        :param jitter: Maximum number of seconds randomly added to or removed from each wait.
+        """
+        self.jobs.append(Job(name, interval, func, jitter))
+
+    def _run_job(self, job):
+        """Run a job until the scheduler is stopped. The first run is only delayed by jitter."""
+        delay = random.uniform(0, job.jitter)
+        while not self.stop_event.wait(delay):
+            started = time.monotonic()
+            try:
+                job.func()
+            except Exception as e:
+                print(f"Job {job.name} failed: {e}")
+            elapsed = time.monotonic() - started
+            if self.after_run:
+                try:
+                    self.after_run()
+                except Exception as e:
+                    print(f"After-run hook of job {job.name} failed: {e}")
+            delay = max(0.0, job.interval - elapsed + random.uniform(-job.jitter, job.jitter))
+            print(f"Job {job.name} finished in {elapsed:.1f}s. Next run in {delay:.0f}s.")
+
+    def start(self):
+        """Start one thread per registered job."""
+        for job in self.jobs:
+            thread = threading.Thread(target=self._run_job, args=(job,), name=f"job-{job.name}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        """Ask every job thread to exit once its current run finishes."""
+        self.stop_event.set()
+
+    def run_forever(self):
+        """
+        Start the jobs and block until SIGTERM or SIGINT is received, then wait for running jobs to finish.
+        Must be called from the main thread.
+        """
+        def handle_signal(signum, frame):
+            print(f"Received {signal.Signals(signum).name}. Shutting down after running jobs finish...")
+            self.stop()
+
+        signal.signal(signal.SIGTERM, handle_signal)
+        signal.signal(signal.SIGINT, handle_signal)
+
+        self.start()
+        while not self.stop_event.wait(1):
+            pass
+        for thread in self.threads:
+            thread.join()
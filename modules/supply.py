@@ -0,0 +1,96 @@
+import hashlib
+
+import numpy as np
+
+import modules.constants as constants
+from modules.burn_rate import factorize
+from modules.metrics import metrics
+
+PROJECTION_COLUMNS = ("prun_username", "planet_natural_id", "planet_name", "material_ticker", "material_amount",
+                      "daily_consumption", "days_of_supply", "restock_amount", "essential")
+
+
+def _composite_keys(*columns):
+    """Encode each row of the given equal-length columns as one int64 key."""
+    keys = np.zeros(len(columns[0]), dtype=np.int64)
+    for column in columns:
+        values, codes = factorize(column)
+        keys = keys * len(values) + codes
+    return keys
+
+
+def compute_projection(burn_rates, stock, target_days=constants.DEFAULT_RESTOCK_TARGET_DAYS):
+    """
+    Join burn rates with planet stock and project days of supply and restock amounts.
+    Both tables are encoded into shared integer keys; stock is summed per key with a grouped reduction and
+    matched to the burn rates with a sorted search, so no per-row dictionary lookups are needed.
+    :param burn_rates: List of (prun_username, planet_natural_id, planet_name, material_ticker,
+        daily_consumption, essential) rows with positive consumption.
+    :param stock: List of (prun_username, planet_natural_id, material_ticker, material_amount) rows.
+    :param target_days: Days of consumption to restock up to.
+    :return: List of supply_projection rows in PROJECTION_COLUMNS order.
+    """
+    if not burn_rates:
+        return []
+
+    usernames, natural_ids, planet_names, tickers, consumption, essential = zip(*burn_rates)
+    stock_usernames, stock_natural_ids, stock_tickers, amounts = zip(*stock) if stock else ((), (), (), ())
+    keys = _composite_keys(usernames + stock_usernames, natural_ids + stock_natural_ids, tickers + stock_tickers)
+    burn_keys, stock_keys = keys[:len(burn_rates)], keys[len(burn_rates):]
+
+    # Total stock per key, then look up each burn rate's key among the stocked ones
+    stocked_keys, stock_codes = np.unique(stock_keys, return_inverse=True)
+    stocked_amounts = np.bincount(stock_codes, weights=np.asarray(amounts, dtype=np.float64),
+                                  minlength=len(stocked_keys))
+    on_hand = np.zeros(len(burn_keys))
+    if len(stocked_keys):
+        positions = np.minimum(np.searchsorted(stocked_keys, burn_keys), len(stocked_keys) - 1)
+        matched = stocked_keys[positions] == burn_keys
+        on_hand[matched] = stocked_amounts[positions[matched]]
+
+    consumption = np.asarray(consumption, dtype=np.float64)
+    days_of_supply = on_hand / consumption
+    restock = np.maximum(0.0, target_days * consumption - on_hand)
+
+    return list(zip(usernames, natural_ids, planet_names, tickers, on_hand.tolist(), consumption.tolist(),
+                    days_of_supply.tolist(), restock.tolist(), essential))
+
+
+def _load_inputs(cursor, usernames):
+    """Read the users' positive burn rates and planet stock."""
+    user_placeholders = ", ".join(["%s"] * len(usernames))
+    cursor.execute(f"SELECT prun_username, planet_natural_id, planet_name, material_ticker, daily_consumption, "
+                   f"essential FROM burn_rate WHERE daily_consumption > 0 AND prun_username IN ({user_placeholders})",
+                   list(usernames))
+    burn_rates = [row[:5] + (bool(row[5]),) for row in cursor.fetchall()]
+
+    cursor.execute(f"SELECT p.prun_username, p.planet_natural_id, m.material_ticker, m.material_amount "
+                   f"FROM storage_materials m JOIN user_planets p ON p.id = m.user_planet_id "
+                   f"WHERE p.prun_username IN ({user_placeholders})", list(usernames))
+    return burn_rates, cursor.fetchall()
+
+
+@metrics.timed_stage("supply_projection")
+def update_supply_projection(db, target_days=constants.DEFAULT_RESTOCK_TARGET_DAYS, force=False):
+    """
+    Refresh the supply_projection rows of every user whose stock or burn rates changed.
+    A user's supply:<user> sync_state entry fingerprints the fio_storage:<user> and burn_rate:<user> states
+    the projection was computed from, so this is cheap to call after every inventory or burn rate sync.
+    :param db: Database instance to read from and write to.
+    :param target_days: Days of consumption to restock up to.
+    :param force: Recompute every user with burn rates.
+    :return: List of usernames whose projection was refreshed.
+    """
+    state = db.get_sync_state()
+    fingerprints = {}
+    for stage in state:
+        if stage.startswith("burn_rate:"):
+            username = stage.split(":", 1)[1]
+            sources = (state[stage]["content_hash"],
+                       state.get(f"fio_storage:{username}", {}).get("content_hash", ""),
+                       str(target_days))
+            fingerprints[username] = hashlib.sha256("\0".join(sources).encode("utf-8")).hexdigest()
+    return db.replace_user_rows("supply_projection", PROJECTION_COLUMNS,
+                                lambda cursor, usernames: compute_projection(*_load_inputs(cursor, usernames),
+                                                                             target_days=target_days),
+                                fingerprints, "supply", state, force=force)
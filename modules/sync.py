@@ -0,0 +1,144 @@
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from modules.metrics import metrics
+
+# Sync stages in run order: stage name -> worksheet and the Database methods that parse and apply it
+STAGES = {
+    "pricing": {"sheet_name": "Prices", "parse": "parse_pricing_data", "update": "update_pricing_data"},
+    "shipping": {"sheet_name": "Shipping", "parse": "parse_shipping_data", "update": "update_shipping_data"},
+}
+
+
+class RowFingerprint:
+    """
+    Wraps a stream of sheet rows and hashes each row as it is consumed, so the sheet never has to be held
+    in memory to be fingerprinted. For fully consumed rows the digest is the SHA-256 of their compact JSON list.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.digest = hashlib.sha256(b"[")
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            if self.count:
+                self.digest.update(b",")
+            self.digest.update(json.dumps(row, separators=(",", ":")).encode("utf-8"))
+            self.count += 1
+            yield row
+
+    def hexdigest(self):
+        """Return the SHA-256 hex digest of the rows consumed so far."""
+        digest = self.digest.copy()
+        digest.update(b"]")
+        return digest.hexdigest()
+
+
+def _sheet_rows(google_sheets, sheet_name, page_rows):
+    """Fetch a worksheet whole, or as a paged row stream when page_rows is set."""
+    if page_rows:
+        return google_sheets.iter_rows(sheet_name, page_rows=page_rows)
+    return google_sheets.fetch_data(sheet_name)
+
+
+def _pending_stages(state, modified_time, stages=None):
+    """Return the stages (optionally limited to the given names) that cannot be skipped on modifiedTime alone."""
+    pending = {}
+    for stage, spec in STAGES.items():
+        if stages is not None and stage not in stages:
+            continue
+        previous = state.get(stage)
+        if previous and modified_time and previous["modified_time"] == modified_time:
+            print(f"Skipping {stage}: spreadsheet not modified since the last sync.")
+            continue
+        pending[stage] = spec
+    return pending
+
+
+def _sync_stage(db, stage, spec, sheet_data, previous, modified_time, prune):
+    """
+    Parse one sheet and apply it to the database unless its fingerprint matches the previous run.
+    The sheet is fingerprinted while it is parsed, so it may be a row stream that is read only once.
+    Parsing stops at the end of the data, so rows past that point never affect the fingerprint.
+    """
+    with metrics.stage(stage):
+        rows = RowFingerprint(sheet_data)
+        print(f"Parsing {stage} data...")
+        records = getattr(db, spec["parse"])(rows)
+        content_hash = rows.hexdigest()
+        if previous and previous["content_hash"] == content_hash:
+            print(f"Skipping {stage}: sheet content unchanged since the last sync.")
+            if modified_time:
+                db.set_sync_state(stage, content_hash, modified_time)
+            return None
+
+        result = getattr(db, spec["update"])(records, prune=prune)
+        if result is not None:
+            db.set_sync_state(stage, content_hash, modified_time)
+        return result
+
+
+def run_stages(db, google_sheets, force=False, prune=False, trust_modified_time=False, stages=None,
+               page_rows=None):
+    """
+    Run every sync stage, skipping those whose sheet has not changed since the last successful run.
+    :param db: Database instance to write to.
+    :param google_sheets: GoogleSheets instance to read from.
+    :param force: Run every stage regardless of stored fingerprints.
+    :param prune: Delete rows that no longer appear in the sheet.
+    :param trust_modified_time: Skip fetching a sheet when the spreadsheet's Drive modifiedTime is unchanged.
+        Leave this off for sheets whose values come from formulas such as IMPORTDATA, which change
+        without touching modifiedTime.
+    :param stages: Optional names of the stages to run. Defaults to every stage.
+    :param page_rows: Fetch each sheet in pages of this many rows, so peak memory does not grow with the
+        sheet. By default every sheet is fetched whole in one batched request.
+    """
+    state = {} if force else db.get_sync_state()
+    modified_time = google_sheets.get_modified_time() if trust_modified_time else None
+    pending = _pending_stages(state, modified_time, stages)
+
+    if page_rows:
+        for stage, spec in pending.items():
+            rows = _sheet_rows(google_sheets, spec["sheet_name"], page_rows)
+            _sync_stage(db, stage, spec, rows, state.get(stage), modified_time, prune)
+        return
+
+    # Fetch every remaining worksheet in one batched request
+    sheets = google_sheets.fetch_sheets(spec["sheet_name"] for spec in pending.values())
+
+    for stage, spec in pending.items():
+        _sync_stage(db, stage, spec, sheets[spec["sheet_name"]], state.get(stage), modified_time, prune)
+
+
+def run_pipelined(db, google_sheets, force=False, prune=False, trust_modified_time=False, stages=None,
+                  page_rows=None):
+    """
+    Run every sync stage concurrently. Each stage fetches its own worksheet and starts parsing and
+    writing as soon as that sheet arrives, on its own pooled database connection, so the run takes about
+    as long as the slowest stage instead of the sum of all of them.
+    Takes the same parameters as run_stages.
+    """
+    state = {} if force else db.get_sync_state()
+    modified_time = google_sheets.get_modified_time() if trust_modified_time else None
+    pending = _pending_stages(state, modified_time, stages)
+    if not pending:
+        return
+
+    # Authorize up front so worker threads share one client instead of racing to create it
+    google_sheets.open_spreadsheet()
+
+    def worker(stage, spec):
+        # Each database call checks out its own pooled connection, so stages never share one
+        sheet_data = _sheet_rows(google_sheets, spec["sheet_name"], page_rows)
+        return _sync_stage(db, stage, spec, sheet_data, state.get(stage), modified_time, prune)
+
+    with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+        futures = {executor.submit(worker, stage, spec): stage for stage, spec in pending.items()}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Sync stage {futures[future]} failed: {e}")
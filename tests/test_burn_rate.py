@@ -0,0 +1,37 @@
+import pytest
+
+from modules.burn_rate import MS_PER_DAY, compute_burn_rates, update_burn_rates
+from modules.database import Database
+
+
+def test_orders_on_a_line_share_its_capacity():
+    # A capacity-1 line alternating a 1-day and a 2-day recurring order runs each once every 3 days
+    order_materials = [
+        ("alice", "Planet", "line", "H2O", 10.0, 1),
+        ("alice", "Planet", "line", "H2O", 3.0, 1),
+        ("alice", "Planet", "line", "GRN", 6.0, -1),
+    ]
+    lines = {"line": (1, 3 * MS_PER_DAY)}
+
+    rows = {row[3]: row for row in compute_burn_rates(order_materials, lines, {("alice", "Planet"): "AB-123a"})}
+
+    assert rows["H2O"] == ("alice", "AB-123a", "Planet", "H2O", pytest.approx(13 / 3), True)
+    assert rows["GRN"] == ("alice", "AB-123a", "Planet", "GRN", pytest.approx(-2.0), False)
+
+
+def test_update_burn_rates_sums_the_cycle_of_each_line(tmp_path):
+    db = Database({"backend": "sqlite", "path": str(tmp_path / "test.db")})
+    try:
+        db.sync_user_production("alice", {"line": ("Planet", "FRM", 1)}, {
+            "short": ("line", MS_PER_DAY, True, "r1", (("Water", "H2O", 10.0),), ()),
+            "long": ("line", 2 * MS_PER_DAY, True, "r2", (("Water", "H2O", 3.0),), (("Grain", "GRN", 6.0),)),
+            "once": ("line", MS_PER_DAY, False, "r3", (("Water", "H2O", 100.0),), ()),
+        })
+        db.set_sync_state("production:alice", "a" * 64)
+
+        assert update_burn_rates(db) == ["alice"]
+        rows = db.fetch_rows("SELECT material_ticker, daily_consumption FROM burn_rate ORDER BY material_ticker")
+    finally:
+        db.close()
+
+    assert rows == [("GRN", pytest.approx(-2.0)), ("H2O", pytest.approx(13 / 3))]
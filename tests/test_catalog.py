@@ -0,0 +1,37 @@
+import io
+import json
+
+import pytest
+
+from modules.catalog import iter_json_array
+
+ITEMS = [
+    {"Ticker": "RAT", "Name": "Rations, basic]", "Weight": 0.21},
+    {"Ticker": "DW", "Name": "[Drinking] water,", "Weight": 0.1, "Tags": ["a,b", "]"]},
+    12345.678,
+    "",
+    None,
+    [],
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 4096])
+def test_items_split_across_chunks(chunk_size):
+    text = "\n  " + json.dumps(ITEMS, indent=1)
+    assert list(iter_json_array(io.StringIO(text), chunk_size=chunk_size)) == ITEMS
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 4096])
+def test_number_is_not_cut_at_a_chunk_boundary(chunk_size):
+    assert list(iter_json_array(io.StringIO("[1234567,89]"), chunk_size=chunk_size)) == [1234567, 89]
+
+
+@pytest.mark.parametrize("text", ["[]", " [ \n ] ", "[\n]"])
+def test_empty_array(text):
+    assert list(iter_json_array(io.StringIO(text), chunk_size=1)) == []
+
+
+@pytest.mark.parametrize("text", ["", "{}", '[{"Ticker": "RAT"}', "[1, 2"])
+def test_malformed_input_raises(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text), chunk_size=2))
@@ -0,0 +1,64 @@
+import re
+
+import pytest
+
+from modules.database import Database
+from modules.google import GoogleSheets
+from modules.sync import RowFingerprint
+
+# A Prices sheet whose second material has no price row, so its blank row 6 lies between data rows
+PRICES = [
+    ["Prices"],
+    ["", "Ticker", "", "ANT", "BEN"],
+    ["", "RAT", "", "ANT", "BEN"],
+    ["", "", "", "10", "12.5"],
+    ["", "DW", "", "ANT"],
+    [],
+    ["", "H2O", "", "BEN"],
+    ["", "", "", "3"],
+]
+
+
+def _trim(rows):
+    """Drop trailing empty rows, as the Sheets API does for every range it returns."""
+    rows = list(rows)
+    while rows and not rows[-1]:
+        rows.pop()
+    return rows
+
+
+class FakeWorksheet:
+    row_count = 20  # Sheets keep empty rows below the data
+
+
+class FakeSpreadsheet:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def worksheet(self, sheet_name):
+        return FakeWorksheet()
+
+    def values_get(self, range_name):
+        start, end = map(int, re.search(r"!(\d+):(\d+)$", range_name).groups())
+        return {"values": _trim(self.rows[start - 1:end])}
+
+    def values_batch_get(self, range_names):
+        return {"valueRanges": [{"values": _trim(self.rows)} for _ in range_names]}
+
+
+def _parse(rows):
+    fingerprint = RowFingerprint(rows)
+    return Database.parse_pricing_data(fingerprint), fingerprint.hexdigest()
+
+
+@pytest.mark.parametrize("page_rows", [1, 2, 5, 6, 7, 100])
+def test_paged_rows_parse_like_the_whole_sheet(page_rows):
+    # Page sizes 5 and 6 put the blank row 6 at the start and at the trimmed end of a page
+    sheets = GoogleSheets(credentials_file=None, file_id=None)
+    sheets.spreadsheet = FakeSpreadsheet(PRICES)
+
+    whole = _parse(sheets.fetch_data("Prices"))
+    paged = _parse(sheets.iter_rows("Prices", page_rows=page_rows))
+
+    assert whole[0] == {("RAT", "ANT"): 10.0, ("RAT", "BEN"): 12.5, ("H2O", "BEN"): 3.0}
+    assert paged == whole
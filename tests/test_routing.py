@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from modules.database import Database
+from modules.routing import NO_ROUTE, RouteTable, floyd_warshall
+
+
+def test_floyd_warshall_relaxes_through_intermediate_stops():
+    # A -> B -> C is cheaper than the direct A -> C edge; D has no edges at all
+    cost = np.full((4, 4), np.inf)
+    cost[0, 1], cost[1, 2], cost[0, 2] = 1.0, 2.0, 10.0
+
+    distances, next_hops = floyd_warshall(cost)
+
+    assert distances[0, 2] == pytest.approx(3.0)
+    assert next_hops[0, 2] == 1
+    assert np.isinf(distances[0, 3]) and next_hops[0, 3] == NO_ROUTE
+    assert np.isinf(distances[2, 0]) and next_hops[2, 0] == NO_ROUTE
+    assert np.all(np.diag(distances) == 0.0)
+    assert list(np.diag(next_hops)) == [0, 1, 2, 3]
+
+
+def test_route_table_reconstructs_paths(tmp_path):
+    db = Database({"backend": "sqlite", "path": str(tmp_path / "test.db")})
+    try:
+        db.update_shipping_data({("ANT", "BEN"): 1.0, ("BEN", "MOR"): 2.0, ("ANT", "MOR"): 10.0,
+                                 ("HRT", "ANT"): 4.0})
+        db.set_sync_state("shipping", "s" * 64)
+        routes = RouteTable(db, cache_dir=str(tmp_path / "routes"))
+    finally:
+        db.close()
+
+    assert routes.route("ANT", "MOR") == (pytest.approx(3.0), ["ANT", "BEN", "MOR"])
+    assert routes.route("HRT", "MOR") == (pytest.approx(7.0), ["HRT", "ANT", "BEN", "MOR"])
+    assert routes.route("MOR", "ANT") is None
+    assert routes.cost("MOR", "ANT") is None
+    assert routes.route("ANT", "UNKNOWN") is None
+    assert routes.route("BEN", "BEN") == (0.0, ["BEN"])
+    assert routes.cost_matrix(["ANT", "MOR", "UNKNOWN"]).tolist() == [[0.0, 3.0, np.inf], [np.inf, 0.0, np.inf],
+                                                                      [np.inf, np.inf, 0.0]]